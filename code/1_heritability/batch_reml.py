@@ -0,0 +1,236 @@
+import os
+import argparse
+import contextlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.linalg import eigh
+from scipy.stats import chi2
+
+import gcta_io
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:
+    threadpool_limits = None
+
+# ---------------------------------------------------------
+# Batch SNP heritability for many phenotypes (one GRM, one variance component)
+#
+# Model as in `gcta64 --reml`: y = Xb + g + e, V = Vg A + Ve I.
+# With A = U S U^T, rotating y and X by U^T makes V diagonal:
+#   V* = Vp * (h2 S + (1 - h2) I)
+# so the REML likelihood profiled over Vp is a cheap 1-D function of h2.
+# It is maximized on a grid and refined by golden-section search, for all
+# phenotypes at once. The eigendecomposition is done once per set of
+# subjects with complete data, so phenotypes with the same missingness
+# pattern share it.
+#
+# SE(h2) comes from the curvature of the profile likelihood; the LRT is
+# against h2 = 0 with p = 0.5 * P(chi2_1 > LRT), as reported by GCTA.
+# ---------------------------------------------------------
+
+missing_codes = ["NA", "-9", "NaN", "nan", "."]
+invphi = (np.sqrt(5) - 1) / 2
+
+
+# ---------------------------------------------------------
+# Function: input files (GCTA layout: FID, IID, values...)
+# ---------------------------------------------------------
+def read_table(path, header, numeric=True):
+    # IDs stay strings; columns are named 1, 2, ... (as --mpheno) without a header
+    table = pd.read_csv(path, sep=r"\s+", header=0 if header else None, na_values=missing_codes, dtype=str)
+    names = list(table.columns[2:]) if header else [str(i) for i in range(1, table.shape[1] - 1)]
+    table.columns = ["FID", "IID"] + [str(name) for name in names]
+    table = table.set_index(["FID", "IID"])
+    return table.apply(pd.to_numeric, errors="coerce") if numeric else table
+
+
+def covariate_matrix(index, covar=None, qcovar=None):
+    # Intercept + one-hot categorical covariates + quantitative covariates
+    parts = [pd.DataFrame({"intercept": 1.0}, index=index)]
+    if covar is not None:
+        cat = covar.reindex(index)
+        dummies = pd.get_dummies(cat, drop_first=True, dtype=float)
+        dummies.loc[cat.isna().any(axis=1)] = np.nan
+        parts.append(dummies)
+    if qcovar is not None:
+        parts.append(qcovar.reindex(index).astype(float))
+    return pd.concat(parts, axis=1)
+
+
+def orthonormal_basis(X, tol=1e-8):
+    # REML only depends on the column space of X; this also drops collinear columns
+    q, r = np.linalg.qr(X)
+    keep = np.abs(np.diag(r)) > tol * np.abs(np.diag(r)).max()
+    return q[:, keep]
+
+
+# ---------------------------------------------------------
+# Function: REML log-likelihood in the eigenbasis
+# ---------------------------------------------------------
+def reml_loglik(h2, s, Xr, XX, Yr):
+    # h2: scalar (shared by all phenotypes) or (k,); Xr: (n, p) orthonormal, rotated
+    # XX: (n, p*p) row-wise outer products of Xr; Yr: (n, k)
+    n, p = Xr.shape
+    W = 1 / np.maximum(1 + np.multiply.outer(s - 1, h2), 1e-10)
+    if W.ndim == 1:
+        W = W[:, None]
+
+    WY = W * Yr
+    XtWX = (W.T @ XX).reshape(-1, p, p)
+    XtWy = WY.T @ Xr
+    yWy = np.einsum("ik,ik->k", WY, Yr)
+    beta = np.linalg.solve(XtWX, XtWy[..., None])[..., 0]
+    resid = yWy - (XtWy * beta).sum(axis=1)
+
+    nu = n - p
+    vp = resid / nu
+    logdet_v = -np.log(W).sum(axis=0)
+    _, logdet_xwx = np.linalg.slogdet(XtWX)
+    loglik = -0.5 * (nu * np.log(2 * np.pi * vp) + logdet_v + logdet_xwx + nu)
+    return loglik, vp
+
+
+def fit_h2(s, Xr, XX, Yr, grid_size=101, tol=1e-6, max_iter=60):
+    def f(h2):
+        return reml_loglik(h2, s, Xr, XX, Yr)[0]
+
+    # Grid: W is shared by all phenotypes, so each point costs one pass over Yr
+    grid = np.linspace(0, 1, grid_size)
+    ll_grid = np.stack([f(h) for h in grid])
+    best = ll_grid.argmax(axis=0)
+    h2 = grid[best]
+    ll = ll_grid[best, np.arange(len(best))]
+
+    # Golden-section search inside the bracket around the best grid point
+    a = grid[np.maximum(best - 1, 0)]
+    b = grid[np.minimum(best + 1, grid_size - 1)]
+    c, d = b - invphi * (b - a), a + invphi * (b - a)
+    fc, fd = f(c), f(d)
+    for _ in range(max_iter):
+        if (b - a).max() < tol:
+            break
+        left = fc >= fd
+        b = np.where(left, d, b)
+        a = np.where(left, a, c)
+        x = np.where(left, b - invphi * (b - a), a + invphi * (b - a))
+        fx = f(x)
+        c, fc, d, fd = (np.where(left, x, d), np.where(left, fx, fd),
+                        np.where(left, c, x), np.where(left, fc, fx))
+
+    for x, fx in ((c, fc), (d, fd)):
+        better = fx > ll
+        h2, ll = np.where(better, x, h2), np.where(better, fx, ll)
+
+    # Curvature of the profile likelihood (shifted inside [0, 1] at the boundary)
+    eps = 1e-4
+    centre = np.clip(h2, eps, 1 - eps)
+    curvature = (f(centre + eps) - 2 * f(centre) + f(centre - eps)) / eps ** 2
+    se = np.where(curvature < 0, 1 / np.sqrt(np.abs(curvature)), np.nan)
+
+    _, vp = reml_loglik(h2, s, Xr, XX, Yr)
+    ll0 = f(0.0)
+    lrt = np.maximum(2 * (ll - ll0), 0)
+    return pd.DataFrame({
+        "h2": h2, "SE": se, "Vg": h2 * vp, "Ve": (1 - h2) * vp, "Vp": vp,
+        "LogL": ll, "LogL0": ll0, "LRT": lrt, "Pval": 0.5 * chi2.sf(lrt, 1),
+    })
+
+
+# ---------------------------------------------------------
+# Function: one group of phenotypes with the same observed subjects
+# ---------------------------------------------------------
+def blas_threads(n_threads):
+    return threadpool_limits(n_threads) if threadpool_limits else contextlib.nullcontext()
+
+
+def fit_group(grm, X, Y, n_threads, chunk_size, grid_size):
+    # Multithreaded BLAS for the O(n^3) eigendecomposition ...
+    start = time.time()
+    with blas_threads(n_threads):
+        s, U = eigh(grm, overwrite_a=True, check_finite=False, driver="evd")
+        s = np.maximum(s, 0)  # tiny negative eigenvalues from rounding
+        Xr = U.T @ orthonormal_basis(X)
+        Yr = U.T @ Y
+    XX = np.einsum("ip,iq->ipq", Xr, Xr).reshape(len(Xr), -1)
+    print(f"  eigendecomposition and rotation: {time.time() - start:.1f} s")
+
+    # ... then one single-threaded phenotype chunk per core
+    chunks = [slice(i, i + chunk_size) for i in range(0, Y.shape[1], chunk_size)]
+    with blas_threads(1), ThreadPoolExecutor(max_workers=n_threads) as pool:
+        results = list(pool.map(lambda chunk: fit_h2(s, Xr, XX, Yr[:, chunk], grid_size), chunks))
+    table = pd.concat(results, ignore_index=True)
+    table.insert(0, "N", len(Y))
+    return table
+
+
+def batch_reml(grm_prefix, pheno, covar=None, qcovar=None, n_threads=1, chunk_size=64, grid_size=101,
+               complete_cases=False):
+    grm, _, ids = gcta_io.read_grm(grm_prefix, with_n=False)
+    index = pd.MultiIndex.from_frame(ids)
+
+    Y = pheno.reindex(index)
+    X = covariate_matrix(index, covar, qcovar)
+    has_covariates = X.notna().all(axis=1).values
+    observed = Y.notna().values & has_covariates[:, None]
+    if complete_cases:
+        observed[:] = observed.all(axis=1)[:, None]
+
+    # Phenotypes with the same observed subjects share one eigendecomposition
+    patterns = pd.Series([col.tobytes() for col in observed.T], index=Y.columns)
+    tables = []
+    for g, (_, columns) in enumerate(patterns.groupby(patterns, sort=False)):
+        columns = list(columns.index)
+        rows = observed[:, Y.columns.get_loc(columns[0])]
+        print(f"Group {g + 1}: {len(columns)} phenotypes, {rows.sum()} subjects")
+        if rows.sum() <= X.shape[1] + 1:
+            print("  too few subjects - skipped")
+            continue
+
+        table = fit_group(grm[np.ix_(rows, rows)], X.values[rows], Y[columns].values[rows], n_threads,
+                          chunk_size, grid_size)
+        table.insert(0, "Phenotype", columns)
+        tables.append(table)
+
+    if not tables:
+        raise ValueError("no phenotype has enough subjects with complete covariates")
+    return pd.concat(tables, ignore_index=True).set_index("Phenotype").reindex(Y.columns).reset_index()
+
+
+# ---------------------------------------------------------
+# Main
+# ---------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SNP heritability of many phenotypes from one GRM")
+    parser.add_argument("--grm", required=True, help="GRM prefix (.grm.bin/.grm.id)")
+    parser.add_argument("--pheno", required=True, help="FID, IID, phenotype columns")
+    parser.add_argument("--mpheno", nargs="+", help="phenotype columns to fit (1-based numbers or names); default all")
+    parser.add_argument("--covar", help="categorical covariates (e.g. sex, site)")
+    parser.add_argument("--qcovar", help="quantitative covariates (e.g. age, PCs)")
+    parser.add_argument("--header", action="store_true", help="input files have a header line")
+    parser.add_argument("--complete-cases", action="store_true",
+                        help="use subjects observed for every phenotype (one eigendecomposition)")
+    parser.add_argument("--grid", type=int, default=101, help="h2 grid points before golden-section refinement")
+    parser.add_argument("--chunk-size", type=int, default=64, help="phenotypes per parallel task")
+    parser.add_argument("--thread-num", type=int, default=os.cpu_count())
+    parser.add_argument("--out", required=True, help="output CSV")
+    args = parser.parse_args()
+
+    pheno = read_table(args.pheno, args.header)
+    if args.mpheno:
+        pheno = pheno[args.mpheno]
+    covar = read_table(args.covar, args.header, numeric=False) if args.covar else None
+    qcovar = read_table(args.qcovar, args.header) if args.qcovar else None
+
+    start = time.time()
+    results = batch_reml(args.grm, pheno, covar, qcovar, n_threads=args.thread_num, chunk_size=args.chunk_size,
+                         grid_size=args.grid, complete_cases=args.complete_cases)
+
+    out_dir = os.path.dirname(args.out)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    results.to_csv(args.out, index=False)
+    print(f"{len(results)} phenotypes in {time.time() - start:.1f} s, saved to {args.out}")
@@ -0,0 +1,107 @@
+import os
+import numpy as np
+import pandas as pd
+
+# ---------------------------------------------------------
+# Readers/writers for PLINK and GCTA file formats
+#
+# GRM binary format (as written by gcta64 --make-grm):
+#   <prefix>.grm.bin    lower triangle incl. diagonal, row by row, float32
+#   <prefix>.grm.N.bin  number of SNPs per pair, same layout, float32
+#   <prefix>.grm.id     FID and IID, tab-separated, no header
+# ---------------------------------------------------------
+
+
+def read_fam(bfile):
+    fam = pd.read_csv(f"{bfile}.fam", sep=r"\s+", header=None, usecols=[0, 1], dtype=str)
+    fam.columns = ["FID", "IID"]
+    return fam
+
+
+def read_bim(bfile):
+    bim = pd.read_csv(f"{bfile}.bim", sep=r"\s+", header=None, usecols=[0, 1], dtype=str)
+    bim.columns = ["CHR", "SNP"]
+    return bim
+
+
+def read_ids(path):
+    ids = pd.read_csv(path, sep=r"\s+", header=None, usecols=[0, 1], dtype=str)
+    ids.columns = ["FID", "IID"]
+    return ids
+
+
+# ---------------------------------------------------------
+# Function: PLINK .bed (SNP-major, 2 bits per genotype)
+# ---------------------------------------------------------
+bed_magic = bytes([0x6C, 0x1B, 0x01])
+
+
+def open_bed(bfile, n_samples, n_snps):
+    path = f"{bfile}.bed"
+    with open(path, "rb") as f:
+        if f.read(3) != bed_magic:
+            raise ValueError(f"{path} is not a SNP-major PLINK .bed file")
+
+    bytes_per_snp = (n_samples + 3) // 4
+    expected = 3 + n_snps * bytes_per_snp
+    if os.path.getsize(path) != expected:
+        raise ValueError(f"{path} has {os.path.getsize(path)} bytes, expected {expected} from .fam/.bim")
+    return np.memmap(path, dtype=np.uint8, mode="r", offset=3, shape=(n_snps, bytes_per_snp))
+
+
+def genotype_lookup(dtype=np.float64):
+    # Each byte holds 4 genotypes, lowest bits first. Codes are counts of the
+    # A1 allele: 00 -> 2, 01 -> missing, 10 -> 1, 11 -> 0
+    codes = np.array([2.0, np.nan, 1.0, 0.0], dtype=dtype)
+    byte = np.arange(256)
+    return np.stack([codes[(byte >> shift) & 3] for shift in (0, 2, 4, 6)], axis=1)
+
+
+def decode_bed(bed_rows, lookup, n_samples, sample_idx=None):
+    # (SNPs, bytes) -> (samples, SNPs) dosage matrix with NaN for missing
+    dosage = lookup[bed_rows].reshape(bed_rows.shape[0], -1)[:, :n_samples]
+    if sample_idx is not None:
+        dosage = dosage[:, sample_idx]
+    return np.ascontiguousarray(dosage.T)
+
+
+# ---------------------------------------------------------
+# Function: GRM files
+# ---------------------------------------------------------
+def write_grm(prefix, grm, n_snps, ids):
+    out_dir = os.path.dirname(prefix)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+
+    with open(f"{prefix}.grm.bin", "wb") as f_grm, open(f"{prefix}.grm.N.bin", "wb") as f_n:
+        for i in range(grm.shape[0]):
+            grm[i, :i + 1].astype(np.float32).tofile(f_grm)
+            if np.ndim(n_snps) == 0:
+                np.full(i + 1, n_snps, dtype=np.float32).tofile(f_n)
+            else:
+                n_snps[i, :i + 1].astype(np.float32).tofile(f_n)
+
+    ids[["FID", "IID"]].to_csv(f"{prefix}.grm.id", sep="\t", header=False, index=False)
+
+
+def _read_lower_triangle(path, n):
+    values = np.fromfile(path, dtype=np.float32)
+    if values.size != n * (n + 1) // 2:
+        raise ValueError(f"{path} has {values.size} values, expected {n * (n + 1) // 2} for {n} subjects")
+
+    matrix = np.empty((n, n), dtype=np.float64)
+    start = 0
+    for i in range(n):
+        matrix[i, :i + 1] = values[start:start + i + 1]
+        start += i + 1
+    for i in range(n):
+        matrix[:i, i] = matrix[i, :i]
+    return matrix
+
+
+def read_grm(prefix, with_n=True):
+    ids = read_ids(f"{prefix}.grm.id")
+    n = len(ids)
+    grm = _read_lower_triangle(f"{prefix}.grm.bin", n)
+    n_snps = _read_lower_triangle(f"{prefix}.grm.N.bin", n) if with_n else None
+    return grm, n_snps, ids
@@ -0,0 +1,221 @@
+import os
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy.linalg import get_blas_funcs
+
+import gcta_io
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:
+    threadpool_limits = None
+
+# ---------------------------------------------------------
+# Genetic Relationship Matrix without the GCTA binary
+#
+# Same estimator as `gcta64 --make-grm`:
+#   A_jk = 1/N_jk * sum_i (x_ij - 2p_i)(x_ik - 2p_i) / (2p_i(1 - p_i))
+#   A_jj = 1 + 1/N_jj * sum_i (x_ij^2 - (1 + 2p_i)x_ij + 2p_i^2) / (2p_i(1 - p_i))
+# where N_jk counts SNPs observed in both subjects.
+#
+# The .bed is memory-mapped and read in SNP blocks, so memory is the n x n
+# accumulators plus one block. Only the lower triangle is accumulated (BLAS
+# syrk), which is also what the .grm.bin layout stores.
+# ---------------------------------------------------------
+
+autosomes = [str(c) for c in range(1, 23)]
+
+
+# ---------------------------------------------------------
+# Function: standardize one SNP block
+# ---------------------------------------------------------
+def standardize_block(dosage, maf):
+    # dosage: (samples, SNPs) with NaN for missing genotypes
+    observed = ~np.isnan(dosage)
+    n_obs = observed.sum(axis=0)
+    p = np.nansum(dosage, axis=0) / np.maximum(2 * n_obs, 1)
+
+    # Monomorphic SNPs carry no information and would divide by zero
+    keep = (n_obs > 0) & (np.minimum(p, 1 - p) > max(maf, 0.0))
+    if not keep.all():
+        dosage, observed, p = dosage[:, keep], observed[:, keep], p[keep]
+
+    var = 2 * p * (1 - p)
+    z = (dosage - 2 * p) / np.sqrt(var)
+    diag = np.nansum((dosage ** 2 - (1 + 2 * p) * dosage + 2 * p ** 2) / var, axis=1)
+
+    has_missing = not observed.all()
+    if has_missing:
+        z[~observed] = 0.0
+    return z, (observed if has_missing else None), diag, int(keep.sum())
+
+
+# ---------------------------------------------------------
+# Function: accumulate the GRM over a set of SNPs
+# ---------------------------------------------------------
+def accumulate_grm(bed, snp_idx, n_samples, sample_idx, block_size, maf, dtype):
+    n = len(sample_idx) if sample_idx is not None else n_samples
+    lookup = gcta_io.genotype_lookup(dtype)
+    syrk = get_blas_funcs("syrk", dtype=dtype)
+
+    # Fortran order lets syrk update the accumulators in place
+    grm = np.zeros((n, n), dtype=dtype, order="F")
+    n_pair = None  # pairwise counts, only allocated once a block has missing genotypes
+    n_complete = 0  # SNPs observed in every subject
+    diag = np.zeros(n, dtype=np.float64)
+    n_used = 0
+
+    blocks = [snp_idx[i:i + block_size] for i in range(0, len(snp_idx), block_size)]
+
+    def decode(block):
+        return gcta_io.decode_bed(bed[block], lookup, n_samples, sample_idx)
+
+    # Decode the next block while BLAS works on the current one
+    with ThreadPoolExecutor(max_workers=1) as reader:
+        pending = reader.submit(decode, blocks[0]) if blocks else None
+        for i in range(len(blocks)):
+            dosage = pending.result()
+            if i + 1 < len(blocks):
+                pending = reader.submit(decode, blocks[i + 1])
+
+            z, observed, block_diag, kept = standardize_block(dosage, maf)
+            if kept == 0:
+                continue
+            # Z Z^T into the lower triangle; z.T is Fortran-contiguous, so no copy
+            grm = syrk(1.0, z.T, beta=1.0, c=grm, trans=1, lower=1, overwrite_c=1)
+            diag += block_diag
+            n_used += kept
+
+            if observed is None:
+                n_complete += kept
+            else:
+                if n_pair is None:
+                    n_pair = np.zeros((n, n), dtype=dtype, order="F")
+                w = observed.astype(dtype)
+                n_pair = syrk(1.0, w.T, beta=1.0, c=n_pair, trans=1, lower=1, overwrite_c=1)
+
+            if (i + 1) % 50 == 0 or i + 1 == len(blocks):
+                print(f"  {min((i + 1) * block_size, len(snp_idx))} / {len(snp_idx)} SNPs")
+
+    return grm, n_pair, n_complete, diag, n_used
+
+
+def finalize_grm(grm, n_pair, n_complete, diag):
+    # Lower triangle only; the upper triangle is never read
+    if n_pair is None:
+        n_snps = float(n_complete)
+        grm /= max(n_snps, 1.0)
+        np.fill_diagonal(grm, 1 + diag / max(n_snps, 1.0))
+        return grm, n_snps
+
+    n_pair += n_complete
+    np.maximum(n_pair, 1, out=n_pair)
+    for j in range(grm.shape[0]):
+        grm[j:, j] /= n_pair[j:, j]
+    np.fill_diagonal(grm, 1 + diag / np.diagonal(n_pair))
+    return grm, n_pair
+
+
+def make_grm(bfile, out, keep=None, chromosomes=None, by_chr=False, maf=0.0, block_size=2048, dtype=np.float64):
+    fam = gcta_io.read_fam(bfile)
+    bim = gcta_io.read_bim(bfile)
+    bed = gcta_io.open_bed(bfile, len(fam), len(bim))
+
+    sample_idx = None
+    ids = fam
+    if keep is not None:
+        keep_ids = gcta_io.read_ids(keep)
+        mask = (fam["FID"] + " " + fam["IID"]).isin(keep_ids["FID"] + " " + keep_ids["IID"]).values
+        sample_idx = np.flatnonzero(mask)
+        ids = fam.iloc[sample_idx].reset_index(drop=True)
+    print(f"{len(ids)} subjects, {len(bim)} SNPs in {bfile}")
+
+    if chromosomes is not None:
+        bim = bim[bim["CHR"].isin(chromosomes)]
+
+    groups = [(f"chr{c}", g.index.values) for c, g in bim.groupby("CHR", sort=False)] if by_chr \
+        else [(None, bim.index.values)]
+
+    prefixes = []
+    for label, snp_idx in groups:
+        start = time.time()
+        prefix = f"{out}.{label}" if label else out
+        print(f"Building {prefix} from {len(snp_idx)} SNPs")
+
+        grm, n_pair, n_complete, diag, n_used = accumulate_grm(bed, snp_idx, len(fam), sample_idx,
+                                                                block_size, maf, dtype)
+        grm, n_snps = finalize_grm(grm, n_pair, n_complete, diag)
+        gcta_io.write_grm(prefix, grm, n_snps, ids)
+        prefixes.append(prefix)
+        print(f"{prefix}: {n_used} SNPs used, {time.time() - start:.1f} s")
+    return prefixes
+
+
+# ---------------------------------------------------------
+# Function: merge partial GRMs (same as gcta64 --mgrm --make-grm)
+# ---------------------------------------------------------
+def merge_grms(prefixes, out, chunk=1 << 24):
+    ids = gcta_io.read_ids(f"{prefixes[0]}.grm.id")
+    for prefix in prefixes[1:]:
+        if not gcta_io.read_ids(f"{prefix}.grm.id").equals(ids):
+            raise ValueError(f"{prefix}.grm.id does not list the same subjects as {prefixes[0]}.grm.id")
+
+    # Work on the flat lower triangles in chunks to keep memory bounded
+    size = len(ids) * (len(ids) + 1) // 2
+    parts = [(np.memmap(f"{p}.grm.bin", dtype=np.float32, mode="r", shape=(size,)),
+              np.memmap(f"{p}.grm.N.bin", dtype=np.float32, mode="r", shape=(size,))) for p in prefixes]
+
+    out_dir = os.path.dirname(out)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    with open(f"{out}.grm.bin", "wb") as f_grm, open(f"{out}.grm.N.bin", "wb") as f_n:
+        for start in range(0, size, chunk):
+            stop = min(start + chunk, size)
+            weighted = np.zeros(stop - start, dtype=np.float64)
+            total = np.zeros(stop - start, dtype=np.float64)
+            for grm, n_snps in parts:
+                weighted += grm[start:stop].astype(np.float64) * n_snps[start:stop]
+                total += n_snps[start:stop]
+            (weighted / np.maximum(total, 1)).astype(np.float32).tofile(f_grm)
+            total.astype(np.float32).tofile(f_n)
+    ids.to_csv(f"{out}.grm.id", sep="\t", header=False, index=False)
+    print(f"Merged {len(prefixes)} GRMs into {out}")
+
+
+# ---------------------------------------------------------
+# Main
+# ---------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a GCTA-compatible GRM from PLINK binary files")
+    parser.add_argument("--bfile", help="PLINK prefix (.bed/.bim/.fam)")
+    parser.add_argument("--out", required=True, help="output prefix for .grm.bin/.grm.N.bin/.grm.id")
+    parser.add_argument("--keep", help="file with FID and IID of the subjects to keep")
+    parser.add_argument("--autosome", action="store_true", help="use chromosomes 1-22 only")
+    parser.add_argument("--chr", nargs="+", help="use these chromosomes only")
+    parser.add_argument("--by-chr", action="store_true", help="write one partial GRM per chromosome (<out>.chr<N>)")
+    parser.add_argument("--mgrm", help="file listing GRM prefixes to merge into --out instead of building")
+    parser.add_argument("--maf", type=float, default=0.0, help="exclude SNPs with MAF at or below this value")
+    parser.add_argument("--block-size", type=int, default=2048, help="SNPs decoded per block")
+    parser.add_argument("--float32", action="store_true", help="accumulate in single precision (half the memory)")
+    parser.add_argument("--thread-num", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    if args.mgrm:
+        with open(args.mgrm) as f:
+            merge_grms([line.strip() for line in f if line.strip()], args.out)
+    elif args.bfile:
+        chromosomes = args.chr or (autosomes if args.autosome else None)
+        if threadpool_limits:
+            threadpool_limits(args.thread_num)
+        prefixes = make_grm(args.bfile, args.out, keep=args.keep, chromosomes=chromosomes, by_chr=args.by_chr,
+                            maf=args.maf, block_size=args.block_size,
+                            dtype=np.float32 if args.float32 else np.float64)
+        if args.by_chr:
+            with open(f"{args.out}.mgrm", "w") as f:
+                f.write("\n".join(prefixes) + "\n")
+            print(f"Partial GRMs listed in {args.out}.mgrm")
+    else:
+        parser.error("one of --bfile or --mgrm is required")
@@ -0,0 +1,217 @@
+import os
+import re
+import json
+import time
+import shutil
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import gcta_io
+
+# ---------------------------------------------------------
+# Parallel `gcta64 --reml` over every phenotype column of the modality tables
+#
+# Writes GCTA input files (pheno per modality, covar, qcovar) in the order
+# of the .grm.id, then runs one REML job per --mpheno column. Jobs run
+# concurrently with --thread-num each, so jobs x threads stays within the
+# core budget. A phenotype whose .hsq already exists is not rerun, and all
+# .hsq/.log outputs are collected into one table.
+# ---------------------------------------------------------
+
+id_column = "subjectkey"
+
+
+def available_cores():
+    if os.environ.get("SLURM_CPUS_PER_TASK"):
+        return int(os.environ["SLURM_CPUS_PER_TASK"])
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count()
+
+
+# ---------------------------------------------------------
+# Function: GCTA input files
+# ---------------------------------------------------------
+def aligned(table, ids):
+    # Rows in .grm.id order, matched on IID; subjects not in the table become NA
+    table = table.drop_duplicates(id_column).set_index(id_column)
+    return pd.concat([ids, table.reindex(ids["IID"]).reset_index(drop=True)], axis=1)
+
+
+def write_gcta_table(table, path):
+    table.to_csv(path, sep="\t", header=False, index=False, na_rep="NA")
+
+
+def write_inputs(ids, modalities, demo, covar_columns, qcovar_columns, work_dir):
+    os.makedirs(work_dir, exist_ok=True)
+    jobs = []
+    for modality, path in modalities.items():
+        table = pd.read_csv(path)
+        columns = [c for c in table.columns if c != id_column and pd.api.types.is_numeric_dtype(table[c])]
+        pheno_path = os.path.join(work_dir, f"{modality}_pheno.txt")
+        write_gcta_table(aligned(table[[id_column] + columns], ids), pheno_path)
+        # --mpheno is the 1-based column number after FID/IID
+        pd.DataFrame({"mpheno": range(1, len(columns) + 1), "phenotype": columns}).to_csv(
+            os.path.join(work_dir, f"{modality}_pheno_columns.csv"), index=False)
+        jobs += [(modality, i + 1, column, pheno_path) for i, column in enumerate(columns)]
+
+    covar_paths = {}
+    for flag, columns in (("covar", covar_columns), ("qcovar", qcovar_columns)):
+        if columns:
+            covar_paths[flag] = os.path.join(work_dir, f"{flag}.txt")
+            write_gcta_table(aligned(demo[[id_column] + columns], ids), covar_paths[flag])
+    return jobs, covar_paths
+
+
+# ---------------------------------------------------------
+# Function: parse GCTA output
+# ---------------------------------------------------------
+hsq_names = {"V(G)": "Vg", "V(e)": "Ve", "Vp": "Vp", "V(G)/Vp": "h2", "logL": "LogL", "logL0": "LogL0",
+             "LRT": "LRT", "Pval": "Pval", "n": "N"}
+
+
+def parse_hsq(path):
+    row = {}
+    with open(path) as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) >= 2 and fields[0] in hsq_names:
+                name = hsq_names[fields[0]]
+                row[name] = float(fields[1])
+                if len(fields) >= 3:
+                    row[f"{name}_SE"] = float(fields[2])
+    row["SE"] = row.pop("h2_SE", float("nan"))
+    return row
+
+
+def count_iterations(text):
+    # Rows of the "Iter.  logL  V(G)  V(e)" block that follows the header line
+    if "Iter." not in text:
+        return 0
+    iterations = 0
+    for line in text.split("Iter.", 1)[1].splitlines()[1:]:
+        match = re.match(r"\s*(\d+)\s+-?\d", line)
+        if match is None:
+            break
+        iterations = int(match.group(1))
+    return iterations
+
+
+def parse_log(path):
+    row = {"Converged": False, "Iterations": 0, "Constrained": False, "Warnings": 0, "Error": ""}
+    try:
+        with open(path, errors="replace") as f:
+            text = f.read()
+    except OSError:
+        return row
+
+    row["Converged"] = "converged" in text.lower() and "not converge" not in text.lower()
+    row["Constrained"] = "constrained" in text.lower()
+    row["Warnings"] = len(re.findall(r"^Warning", text, flags=re.MULTILINE))
+    row["Iterations"] = count_iterations(text)
+    errors = re.findall(r"^Error:?\s*(.*)$", text, flags=re.MULTILINE)
+    row["Error"] = errors[-1].strip() if errors else ""
+    return row
+
+
+def hsq_done(prefix):
+    try:
+        return "h2" in parse_hsq(f"{prefix}.hsq")
+    except (OSError, ValueError):
+        return False
+
+
+# ---------------------------------------------------------
+# Function: one REML job
+# ---------------------------------------------------------
+def run_reml(job, args, covar_paths):
+    modality, mpheno, phenotype, pheno_path = job
+    prefix = os.path.join(args.work_dir, modality, phenotype)
+    if hsq_done(prefix):
+        return "skipped"
+    os.makedirs(os.path.dirname(prefix), exist_ok=True)
+
+    command = [args.gcta, "--grm", args.grm, "--pheno", pheno_path, "--mpheno", str(mpheno), "--reml",
+               "--out", prefix, "--thread-num", str(args.threads_per_job)]
+    for flag, path in covar_paths.items():
+        command += [f"--{flag}", path]
+
+    start = time.time()
+    with open(f"{prefix}.stdout", "w") as out:
+        returncode = subprocess.call(command, stdout=out, stderr=subprocess.STDOUT)
+    seconds = time.time() - start
+    with open(f"{prefix}.run.json", "w") as f:
+        json.dump({"seconds": seconds, "returncode": returncode, "threads": args.threads_per_job}, f)
+
+    status = "finished" if returncode == 0 and hsq_done(prefix) else "failed"
+    print(f"{modality} / {phenotype}: {status} in {seconds:.1f} s")
+    return status
+
+
+def collect_results(jobs, work_dir):
+    rows = []
+    for modality, mpheno, phenotype, _ in jobs:
+        prefix = os.path.join(work_dir, modality, phenotype)
+        row = {"Modality": modality, "Phenotype": phenotype, "Mpheno": mpheno}
+        try:
+            row.update(parse_hsq(f"{prefix}.hsq"))
+        except (OSError, ValueError):
+            pass
+        row.update(parse_log(f"{prefix}.log"))
+        try:
+            with open(f"{prefix}.run.json") as f:
+                row["Seconds"] = json.load(f)["seconds"]
+        except (OSError, ValueError, KeyError):
+            row["Seconds"] = float("nan")
+        rows.append(row)
+
+    columns = ["Modality", "Phenotype", "Mpheno", "N", "h2", "SE", "Vg", "Vg_SE", "Ve", "Ve_SE", "Vp", "Vp_SE",
+               "LogL", "LogL0", "LRT", "Pval", "Converged", "Iterations", "Constrained", "Warnings", "Error",
+               "Seconds"]
+    return pd.DataFrame(rows).reindex(columns=columns)
+
+
+# ---------------------------------------------------------
+# Main
+# ---------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run gcta64 --reml for every phenotype column in parallel")
+    parser.add_argument("--grm", required=True, help="GRM prefix (IIDs in .grm.id must match subjectkey)")
+    parser.add_argument("--modality", nargs="+", required=True, metavar="NAME=CSV",
+                        help="modality tables keyed by subjectkey, e.g. smri=smri_synthetic_EUR_100.csv")
+    parser.add_argument("--demo", help="covariate table keyed by subjectkey")
+    parser.add_argument("--covar", nargs="*", default=[], help="categorical covariate columns of --demo")
+    parser.add_argument("--qcovar", nargs="*", default=[], help="quantitative covariate columns of --demo")
+    parser.add_argument("--work-dir", default="reml_results")
+    parser.add_argument("--gcta", default="gcta64")
+    parser.add_argument("--cores", type=int, default=available_cores(), help="total core budget")
+    parser.add_argument("--threads-per-job", type=int, default=10)
+    parser.add_argument("--collect-only", action="store_true", help="only parse existing outputs")
+    parser.add_argument("--out", help="consolidated table (default: <work-dir>/heritability_results.csv)")
+    args = parser.parse_args()
+
+    ids = gcta_io.read_ids(f"{args.grm}.grm.id")
+    modalities = dict(item.split("=", 1) for item in args.modality)
+    demo = pd.read_csv(args.demo) if args.demo else None
+    if (args.covar or args.qcovar) and demo is None:
+        parser.error("--covar/--qcovar need --demo")
+    jobs, covar_paths = write_inputs(ids, modalities, demo, args.covar, args.qcovar, args.work_dir)
+
+    if not args.collect_only:
+        if shutil.which(args.gcta) is None:
+            parser.error(f"{args.gcta} not found; set --gcta to the GCTA binary")
+        args.threads_per_job = min(args.threads_per_job, args.cores)
+        n_jobs = max(1, args.cores // args.threads_per_job)
+        print(f"{len(jobs)} phenotypes, {n_jobs} concurrent jobs x {args.threads_per_job} threads")
+        with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+            statuses = list(pool.map(lambda job: run_reml(job, args, covar_paths), jobs))
+        for status in ["finished", "failed", "skipped"]:
+            print(f"{status}: {statuses.count(status)}")
+
+    results = collect_results(jobs, args.work_dir)
+    out = args.out or os.path.join(args.work_dir, "heritability_results.csv")
+    results.to_csv(out, index=False)
+    print(f"Heritability table saved to {out}")
@@ -20,6 +20,15 @@ gcta64 \
   --out ../Out.Demo/GRM_EUR_5130 \                                    # Output prefix for GRM files
   --thread-num 10                                                     # Use 10 threads for faster computation
 
+# Alternative without the GCTA binary (same .grm.bin/.grm.N.bin/.grm.id output).
+# --keep builds the GRM for a subject subset; --by-chr writes per-chromosome
+# partial GRMs that can be merged later with --mgrm <out>.mgrm.
+# python make_grm.py \
+#   --bfile ABCD_QCed_2021_PCair_8620_SNPrsid_final_updated_EUR_5130 \
+#   --autosome \
+#   --out ../Out.Demo/GRM_EUR_5130 \
+#   --thread-num 10
+
 # ----------------------------------------------
 # Step 2: Estimate SNP-based Heritability via REML
 # ----------------------------------------------
@@ -32,3 +41,26 @@ gcta64 \
   --qcovar heritability_demo_conti_data.txt \                         # Quantitative covariates (e.g., age, PCs)
   --out ../Out.Demo/GRM_5130_estimates \                              # Output prefix for heritability results
   --thread-num 10                                                     # Use 10 threads for faster computation
+
+# Alternative for many phenotypes at once: the GRM is eigendecomposed once and
+# every phenotype column is fitted in one pass (h2, SE, LRT and p-value per column).
+# python batch_reml.py \
+#   --grm ../Out.Demo/GRM_EUR_5130 \
+#   --pheno heritability_smri_feature.txt \
+#   --covar heritability_demo_cate_data.txt \
+#   --qcovar heritability_demo_conti_data.txt \
+#   --out ../Out.Demo/GRM_5130_batch_estimates.csv \
+#   --thread-num 10
+
+# To loop Step 2 over every phenotype column with GCTA itself: input files are
+# generated from the modality tables, jobs x --threads-per-job stays within the
+# core budget, finished phenotypes (.hsq present) are skipped, and all .hsq/.log
+# outputs are collected into <work-dir>/heritability_results.csv.
+# python run_gcta_reml.py \
+#   --grm ../Out.Demo/GRM_EUR_5130 \
+#   --modality smri=smri_synthetic_EUR_100.csv count=count_synthetic_EUR_100.csv \
+#   --demo demo_synthetic_EUR_100.csv \
+#   --covar abcd_site race.ethnicity \
+#   --qcovar age \
+#   --work-dir ../Out.Demo/reml \
+#   --cores 40 --threads-per-job 4
@@ -0,0 +1,205 @@
+import os
+import csv
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+# ---------------------------------------------------------
+# Indexed store of every GPS x brain correlation (all seven modalities)
+#
+# code_corr_brianIDPs_w33gps_public.R writes the full tables
+# (output/gps_<modality>_results_w33gps_full.csv) next to the significant-only
+# ones. build packs them into one compressed npz: GPS, modality and IDP are
+# integer codes into name arrays, rows are sorted by (GPS, modality) with the
+# R row order kept inside, and an offset table gives the row range of every
+# GPS x modality block, so a query only touches the blocks it asks for.
+#
+#   python corr_result_store.py build                       # from output/*_full.csv
+#   python corr_result_store.py build --from-stats stats_store
+#   python corr_result_store.py query --gps ADHDeur6 --pfdr 0.01
+#   python corr_result_store.py views                       # output/gps_*_results_w33gps.csv
+# ---------------------------------------------------------
+
+modalities = ["smri", "count", "fa", "rs", "mid", "nback", "sst"]
+default_store = "output/gps_results_w33gps.npz"
+result_columns = ["gps_variable", "brain_variable", "brain_p", "brain_r", "brain_pfdr", "brain_sig"]
+
+
+# ---------------------------------------------------------
+# Function: build
+# ---------------------------------------------------------
+def read_full_tables(result_dir):
+    tables = {}
+    for modality in modalities:
+        path = os.path.join(result_dir, f"gps_{modality}_results_w33gps_full.csv")
+        if os.path.exists(path):
+            tables[modality] = pd.read_csv(path)
+        else:
+            print(f"{modality}: {path} not found - skipped")
+    return tables
+
+
+def stats_tables(store_dir):
+    import corr_stats_store
+
+    tables = {}
+    for modality in modalities:
+        store = corr_stats_store.load_store(store_dir, modality)
+        if store is not None:
+            tables[modality] = corr_stats_store.correlation_table(store)
+    return tables
+
+
+def codes(values, names):
+    lookup = {name: i for i, name in enumerate(names)}
+    return np.array([lookup[v] for v in values], dtype=np.int32)
+
+
+def build_store(tables, path):
+    # Names in first-seen order, so GPS keep the order of gps_variables
+    frames = [table.assign(modality=modality) for modality, table in tables.items()]
+    full = pd.concat(frames, ignore_index=True)
+    gps_names = pd.unique(full["gps_variable"].astype(str))
+    idp_names = pd.unique(full["brain_variable"].astype(str))
+    modality_names = np.array(list(tables))
+
+    gps_code = codes(full["gps_variable"].astype(str), gps_names)
+    modality_code = codes(full["modality"], modality_names)
+    order = np.lexsort((modality_code, gps_code))  # stable: R row order within each block
+
+    # offsets[g, m]:offsets[g, m + 1] are the rows of GPS g in modality m
+    block = (gps_code * len(modality_names) + modality_code)[order]
+    offsets = np.searchsorted(block, np.arange(len(gps_names) * len(modality_names) + 1))
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez_compressed(
+        tmp_path,
+        gps_names=np.array(gps_names, dtype=str),
+        modality_names=modality_names,
+        idp_names=np.array(idp_names, dtype=str),
+        gps=gps_code[order].astype(np.int16),
+        modality=modality_code[order].astype(np.int8),
+        idp=codes(full["brain_variable"].astype(str), idp_names)[order],
+        r=full["brain_r"].values[order].astype(float),
+        p=full["brain_p"].values[order].astype(float),
+        pfdr=full["brain_pfdr"].values[order].astype(float),
+        offsets=offsets,
+    )
+    os.replace(tmp_path, path)
+    return len(full)
+
+
+# ---------------------------------------------------------
+# Class: query API
+# ---------------------------------------------------------
+class ResultStore:
+    def __init__(self, path=default_store):
+        with np.load(path) as data:
+            self.columns = {key: data[key] for key in data.files}
+        self.gps_names = self.columns["gps_names"]
+        self.modality_names = self.columns["modality_names"]
+        self.idp_names = self.columns["idp_names"]
+        self.offsets = self.columns["offsets"]
+        self._idp_lookup = {name: i for i, name in enumerate(self.idp_names)}
+
+    def _codes(self, names, values, kind):
+        if values is None:
+            return np.arange(len(names))
+        values = [values] if isinstance(values, str) else list(values)
+        unknown = set(values) - set(names)
+        if unknown:
+            raise KeyError(f"unknown {kind}: {sorted(unknown)}")
+        return np.flatnonzero(np.isin(names, values))
+
+    def rows(self, gps=None, modality=None, idp=None, pfdr=None, p=None):
+        # Row indices matching every given filter (None = no filter, thresholds are strict "<")
+        n_modality = len(self.modality_names)
+        blocks = [self.offsets[g * n_modality + m: g * n_modality + m + 2]
+                  for g in self._codes(self.gps_names, gps, "GPS")
+                  for m in self._codes(self.modality_names, modality, "modality")]
+        index = np.concatenate([np.arange(start, stop) for start, stop in blocks]) if blocks else np.array([], int)
+        if idp is not None:
+            idp = [idp] if isinstance(idp, str) else list(idp)
+            wanted = [self._idp_lookup[name] for name in idp if name in self._idp_lookup]
+            index = index[np.isin(self.columns["idp"][index], wanted)]
+        if pfdr is not None:
+            index = index[self.columns["pfdr"][index] < pfdr]
+        if p is not None:
+            index = index[self.columns["p"][index] < p]
+        return index
+
+    def query(self, gps=None, modality=None, idp=None, pfdr=None, p=None):
+        index = self.rows(gps, modality, idp, pfdr, p)
+        pfdr_values = self.columns["pfdr"][index]
+        return pd.DataFrame({
+            "modality": self.modality_names[self.columns["modality"][index]],
+            "gps_variable": self.gps_names[self.columns["gps"][index]],
+            "brain_variable": self.idp_names[self.columns["idp"][index]],
+            "brain_p": self.columns["p"][index],
+            "brain_r": self.columns["r"][index],
+            "brain_pfdr": pfdr_values,
+            "brain_sig": significance(pfdr_values),
+        })
+
+    def significant_view(self, modality, alpha=0.05):
+        # The R script's gps_<modality>_results_w33gps.csv (rows in the same order)
+        return self.query(modality=modality, pfdr=alpha)[result_columns].reset_index(drop=True)
+
+
+def significance(pfdr):
+    return np.select([pfdr < 0.0001, pfdr < 0.001, pfdr < 0.01, pfdr < 0.05], ["****", "***", "**", "*"], "")
+
+
+def write_views(store, out_dir):
+    os.makedirs(out_dir, exist_ok=True)
+    for modality in store.modality_names:
+        path = os.path.join(out_dir, f"gps_{modality}_results_w33gps.csv")
+        view = store.significant_view(modality)
+        view.to_csv(path, index=False, quoting=csv.QUOTE_NONNUMERIC)
+        print(f"{modality}: {len(view)} significant pairs -> {path}")
+
+
+# ---------------------------------------------------------
+# Main
+# ---------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Indexed store of all GPS x brain correlations")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="pack the full result tables into the store")
+    build_parser.add_argument("--result-dir", default="output", help="directory of gps_*_results_w33gps_full.csv")
+    build_parser.add_argument("--from-stats", help="build from a corr_stats_store.py store directory instead")
+    build_parser.add_argument("--store", default=default_store)
+
+    query_parser = subparsers.add_parser("query", help="filter pairs by GPS, modality, IDP and thresholds")
+    query_parser.add_argument("--store", default=default_store)
+    query_parser.add_argument("--gps", nargs="+")
+    query_parser.add_argument("--modality", nargs="+")
+    query_parser.add_argument("--idp", nargs="+")
+    query_parser.add_argument("--pfdr", type=float, help="keep pairs with brain_pfdr below this value")
+    query_parser.add_argument("--p", type=float, help="keep pairs with brain_p below this value")
+    query_parser.add_argument("--out", help="save the result as CSV")
+
+    views_parser = subparsers.add_parser("views", help="write the significant-only CSVs of the R script")
+    views_parser.add_argument("--store", default=default_store)
+    views_parser.add_argument("--out-dir", default="output")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        tables = stats_tables(args.from_stats) if args.from_stats else read_full_tables(args.result_dir)
+        if not tables:
+            raise SystemExit("No result tables found")
+        n_rows = build_store(tables, args.store)
+        print(f"{n_rows} pairs from {len(tables)} modalities saved to {args.store}")
+    elif args.command == "query":
+        store = ResultStore(args.store)
+        start = time.perf_counter()
+        result = store.query(args.gps, args.modality, args.idp, args.pfdr, args.p)
+        print(f"{len(result)} pairs ({1000 * (time.perf_counter() - start):.1f} ms)")
+        print(result.to_string(index=False))
+        if args.out:
+            result.to_csv(args.out, index=False)
+    else:
+        write_views(ResultStore(args.store), args.out_dir)
@@ -0,0 +1,276 @@
+import os
+import csv
+import time
+import hashlib
+import argparse
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+# ---------------------------------------------------------
+# Sufficient-statistics store for the GPS x brain correlations
+#
+# Pearson r over pairwise-complete subjects (cor.test after na.omit in
+# code_corr_brianIDPs_w33gps_public.R) only needs, per GPS x IDP pair:
+#   N, Sx, Sy, Sxx, Syy, Sxy
+# summed over the subjects observed in both columns. These are computed with
+# mask matrix products, so adding subjects (absorb) or removing them
+# (retract) is an update of the stored sums, and r / p / FDR for a modality
+# come from the store without the old subject data. Values are shifted by
+# per-column constants fixed at creation to keep the sums well conditioned.
+#
+#   python corr_stats_store.py absorb                       # new subjects of every modality
+#   python corr_stats_store.py retract --gps old_gps.csv --brain old_smri.csv --modality smri --subjects withdrawn.csv
+#   python corr_stats_store.py results                      # output/gps_*_results_w33gps.csv
+#
+# Run from the directory of the R script inputs (data/, output/). Retracting
+# needs the removed subjects' rows as they were absorbed.
+# ---------------------------------------------------------
+
+gps_variables = [
+    "GMeur", "WMeur", "TBVeur", "HEIGHTeur", "CPeur2", "EAeur1", "MDDeur6", "INSOMNIAeur6",
+    "SNORINGeur1", "IQeur2", "PTSDeur4", "ADHDeur6", "DEPeur4", "BMIeur4", "ALCDEP_EURauto",
+    "ASDauto", "ASPauto", "BIPauto", "CANNABISauto", "CROSSauto", "DRINKauto", "EDauto",
+    "NEUROTICISMauto", "OCDauto", "RISK4PCauto", "RISKTOLauto", "SCZ_EURauto", "SMOKERauto",
+    "WORRYauto", "SWBeur4", "GHappiHealth6", "GHappiMeaneur1", "GHappieur2"
+]
+
+# Modality name (as in output/gps_<name>_results_w33gps.csv) -> input table of the R script
+modality_files = {
+    "smri": "data/smri_synthetic_EUR_100.csv",
+    "count": "data/count_synthetic_EUR_100.csv",
+    "fa": "data/fa_synthetic_EUR_100.csv",
+    "rs": "data/rsfmri_synthetic_EUR_100.csv",
+    "mid": "data/midfmri_synthetic_EUR_100.csv",
+    "nback": "data/nbackfmri_synthetic_EUR_100.csv",
+    "sst": "data/sstfmri_synthetic_EUR_100.csv",
+}
+gps_file = "data/gps_eur_synthetic_100.csv"
+
+stat_names = ["N", "Sx", "Sy", "Sxx", "Syy", "Sxy"]
+
+
+# ---------------------------------------------------------
+# Function: statistics of one batch of subjects
+# ---------------------------------------------------------
+def merged_batch(gps, brain):
+    # Inner join on subjectkey, as merge() in the R script
+    brain = brain.drop_duplicates("subjectkey")
+    data = gps[["subjectkey"] + gps_variables].drop_duplicates("subjectkey").merge(brain, on="subjectkey")
+    brain_names = [c for c in brain.columns if c != "subjectkey"]
+    X = data[gps_variables].apply(pd.to_numeric, errors="coerce").values.astype(float)
+    Y = data[brain_names].apply(pd.to_numeric, errors="coerce").values.astype(float)
+    return data["subjectkey"].astype(str).values, brain_names, X, Y
+
+
+def batch_stats(X, Y, shift_x, shift_y):
+    mx, my = ~np.isnan(X), ~np.isnan(Y)
+    x0 = np.where(mx, X - shift_x, 0.0)
+    y0 = np.where(my, Y - shift_y, 0.0)
+    mx, my = mx.astype(float), my.astype(float)
+    return {
+        "N": mx.T @ my,
+        "Sx": x0.T @ my,
+        "Sy": mx.T @ y0,
+        "Sxx": (x0 ** 2).T @ my,
+        "Syy": mx.T @ (y0 ** 2),
+        "Sxy": x0.T @ y0,
+    }
+
+
+# ---------------------------------------------------------
+# Function: store files (<store_dir>/<modality>.npz)
+# ---------------------------------------------------------
+def store_path(store_dir, modality):
+    return os.path.join(store_dir, f"{modality}.npz")
+
+
+def fingerprint(subjectkeys):
+    return hashlib.sha256("\n".join(sorted(subjectkeys)).encode()).hexdigest()
+
+
+def load_store(store_dir, modality):
+    path = store_path(store_dir, modality)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+
+def save_store(store_dir, modality, store):
+    os.makedirs(store_dir, exist_ok=True)
+    store["fingerprint"] = np.array(fingerprint(store["subjectkeys"].tolist()))
+    path = store_path(store_dir, modality)
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez_compressed(tmp_path, **store)
+    os.replace(tmp_path, path)
+
+
+def new_store(brain_names, X, Y):
+    # Shifts are fixed once; any constant works, the first batch's means keep the sums small
+    shift_x = np.nan_to_num(np.nanmean(X, axis=0)) if len(X) else np.zeros(X.shape[1])
+    shift_y = np.nan_to_num(np.nanmean(Y, axis=0)) if len(Y) else np.zeros(Y.shape[1])
+    store = {
+        "subjectkeys": np.array([], dtype=str),
+        "gps_names": np.array(gps_variables),
+        "brain_names": np.array(brain_names),
+        "shift_x": shift_x,
+        "shift_y": shift_y,
+    }
+    store.update({name: np.zeros((len(gps_variables), len(brain_names))) for name in stat_names})
+    return store
+
+
+def aligned_columns(store, brain_names, Y):
+    stored = store["brain_names"].tolist()
+    missing = set(stored) - set(brain_names)
+    extra = set(brain_names) - set(stored)
+    if missing or extra:
+        raise ValueError(f"brain columns differ from the store: {len(missing)} missing, {len(extra)} new "
+                         f"(rebuild the store to change the column set)")
+    order = [brain_names.index(name) for name in stored]
+    return Y[:, order]
+
+
+# ---------------------------------------------------------
+# Function: absorb / retract subjects
+# ---------------------------------------------------------
+def absorb(store, gps, brain, modality):
+    keys, brain_names, X, Y = merged_batch(gps, brain)
+    if store is None:
+        store = new_store(brain_names, X, Y)
+    Y = aligned_columns(store, brain_names, Y)
+
+    # Subjects already in the store are not counted twice
+    new = ~np.isin(keys, store["subjectkeys"])
+    if not new.all():
+        print(f"{modality}: {(~new).sum()} subjects already in the store - skipped")
+    keys, X, Y = keys[new], X[new], Y[new]
+
+    for name, value in batch_stats(X, Y, store["shift_x"], store["shift_y"]).items():
+        store[name] = store[name] + value
+    store["subjectkeys"] = np.union1d(store["subjectkeys"], keys)
+    print(f"{modality}: absorbed {len(keys)} subjects, {len(store['subjectkeys'])} in store")
+    return store
+
+
+def retract(store, gps, brain, modality, subjectkeys=None):
+    # gps/brain hold the values of the removed subjects as they were absorbed
+    keys, brain_names, X, Y = merged_batch(gps, brain)
+    Y = aligned_columns(store, brain_names, Y)
+
+    remove = np.isin(keys, store["subjectkeys"])
+    if subjectkeys is not None:
+        remove &= np.isin(keys, np.asarray(subjectkeys, dtype=str))
+    keys, X, Y = keys[remove], X[remove], Y[remove]
+
+    for name, value in batch_stats(X, Y, store["shift_x"], store["shift_y"]).items():
+        store[name] = store[name] - value
+    store["N"] = np.round(store["N"])  # counts stay exact integers
+    store["subjectkeys"] = np.setdiff1d(store["subjectkeys"], keys)
+    print(f"{modality}: retracted {len(keys)} subjects, {len(store['subjectkeys'])} in store")
+    return store
+
+
+# ---------------------------------------------------------
+# Function: r, p and FDR from the stored sums
+# ---------------------------------------------------------
+def bh_fdr(p):
+    # p.adjust(method = "fdr"): NaN p-values stay NaN and are not counted in n
+    p = np.asarray(p, dtype=float)
+    out = np.full_like(p, np.nan)
+    finite = np.flatnonzero(~np.isnan(p))
+    if len(finite) == 0:
+        return out
+    order = finite[np.argsort(p[finite])]
+    ranked = p[order] * len(order) / np.arange(1, len(order) + 1)
+    adjusted = np.minimum.accumulate(ranked[::-1])[::-1]
+    out[order] = np.minimum(adjusted, 1)
+    return out
+
+
+def significance(pfdr):
+    return np.select([pfdr < 0.0001, pfdr < 0.001, pfdr < 0.01, pfdr < 0.05], ["****", "***", "**", "*"], "")
+
+
+def correlation_table(store):
+    n = store["N"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov = store["Sxy"] - store["Sx"] * store["Sy"] / n
+        var_x = store["Sxx"] - store["Sx"] ** 2 / n
+        var_y = store["Syy"] - store["Sy"] ** 2 / n
+        r = np.clip(cov / np.sqrt(var_x * var_y), -1, 1)
+        t = r * np.sqrt((n - 2) / (1 - r ** 2))
+    p = 2 * stats.t.sf(np.abs(t), n - 2)
+
+    # Row order of the R loop: GPS outer, brain variable inner; pairs with N <= 2 are not tested
+    g, b = np.meshgrid(np.arange(len(store["gps_names"])), np.arange(len(store["brain_names"])), indexing="ij")
+    tested = (n > 2).ravel()
+    table = pd.DataFrame({
+        "gps_variable": store["gps_names"][g.ravel()],
+        "brain_variable": store["brain_names"][b.ravel()],
+        "brain_p": p.ravel(),
+        "brain_r": r.ravel(),
+        "N": n.ravel().astype(int),
+    })[tested].reset_index(drop=True)
+    table["brain_pfdr"] = bh_fdr(table["brain_p"].values)
+    table["brain_sig"] = significance(table["brain_pfdr"].values)
+    return table
+
+
+def write_results(table, out_dir, modality):
+    # Same file and columns as the R script: significant pairs only
+    significant = table[table["brain_sig"] != ""]
+    columns = ["gps_variable", "brain_variable", "brain_p", "brain_r", "brain_pfdr", "brain_sig"]
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, f"gps_{modality}_results_w33gps.csv")
+    significant[columns].to_csv(path, index=False, quoting=csv.QUOTE_NONNUMERIC)
+    return path
+
+
+# ---------------------------------------------------------
+# Main
+# ---------------------------------------------------------
+def read_subjects(path):
+    table = pd.read_csv(path)
+    column = "subjectkey" if "subjectkey" in table.columns else table.columns[0]
+    return table[column].astype(str).tolist()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incremental sufficient statistics for GPS x brain correlations")
+    parser.add_argument("command", choices=["absorb", "retract", "results", "info"])
+    parser.add_argument("--modality", nargs="+", default=list(modality_files), choices=list(modality_files))
+    parser.add_argument("--store-dir", default="stats_store")
+    parser.add_argument("--gps", default=gps_file, help="GPS table with subjectkey and the 33 GPS columns")
+    parser.add_argument("--brain", nargs="+", help="brain tables in --modality order (default: the R script inputs)")
+    parser.add_argument("--subjects", help="retract: CSV listing the subjectkeys to remove (default: all rows given)")
+    parser.add_argument("--out-dir", default="output")
+    args = parser.parse_args()
+
+    brain_paths = dict(zip(args.modality, args.brain)) if args.brain else modality_files
+    gps = pd.read_csv(args.gps, dtype={"subjectkey": str}) if args.command in ("absorb", "retract") else None
+
+    for modality in args.modality:
+        store = load_store(args.store_dir, modality)
+        if args.command == "absorb":
+            brain = pd.read_csv(brain_paths[modality], dtype={"subjectkey": str})
+            save_store(args.store_dir, modality, absorb(store, gps, brain, modality))
+            continue
+        if store is None:
+            print(f"{modality}: no store in {args.store_dir}")
+            continue
+
+        if args.command == "retract":
+            brain = pd.read_csv(brain_paths[modality], dtype={"subjectkey": str})
+            subjects = read_subjects(args.subjects) if args.subjects else None
+            save_store(args.store_dir, modality, retract(store, gps, brain, modality, subjects))
+        elif args.command == "results":
+            start = time.perf_counter()
+            table = correlation_table(store)
+            path = write_results(table, args.out_dir, modality)
+            print(f"{modality}: {len(table)} pairs, {(table['brain_sig'] != '').sum()} significant, "
+                  f"{1000 * (time.perf_counter() - start):.1f} ms -> {path}")
+        else:
+            print(f"{modality}: {len(store['subjectkeys'])} subjects, {len(store['brain_names'])} brain variables, "
+                  f"fingerprint {str(store['fingerprint'])[:12]}")
@@ -1,8 +1,12 @@
 import os
+import sys
 import pandas as pd
 import matplotlib.pyplot as plt
 from statsmodels.stats.multitest import fdrcorrection
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+import stage_profiler
+
 # ---------------------------------------------------------
 # Function: summary from permutation files
 # ---------------------------------------------------------
@@ -157,11 +161,16 @@ if __name__ == "__main__":
     #   - original_corr.csv
     #   - [1-100]-th_permutation_crit.csv
     #   - [1-100]-th_permutation_corr.csv
-    data_folder = "/path/to/your/2block_SGCCA/results"
+    # (or pass it as the first argument, e.g. a sweep/output/<combination> directory)
+    data_folder = sys.argv[1] if len(sys.argv) > 1 else "/path/to/your/2block_SGCCA/results"
     exp_ver_list = [""]  # 현재 폴더 기준, 경로만 사용
+    profiler = stage_profiler.Profiler()
 
+    profiler.mark("load permutations")
     two_block_CCA_summary(data_folder, exp_ver_list)
+    profiler.mark("p-values + plotting")
     two_block_CCA_pval(data_folder, exp_ver_list)
 
+    profiler.mark("fdr")
     for file_name in ['2block_SGCCA_perm_res_crit', '2block_SGCCA_perm_res_corr']:
         CCA_fdrcorrection(data_folder, file_name)
@@ -2,16 +2,23 @@
 # Python script to compute empirical p-values from 3-block SGCCA permutation
 
 import os
+import sys
 import pandas as pd
 import matplotlib.pyplot as plt
 from statsmodels.stats.multitest import fdrcorrection
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+import stage_profiler
+
+profiler = stage_profiler.Profiler()
+
 # === user-defined ===
-result_dir = "./3block/output"
+result_dir = sys.argv[1] if len(sys.argv) > 1 else "./3block/output"  # e.g. a sweep/output/<combination> directory
 perm_summary_dir = os.path.join(result_dir, "perm_summary")
 os.makedirs(perm_summary_dir, exist_ok=True)
 
 # === load data ===
+profiler.mark("load permutations")
 ori_crit = pd.read_csv(os.path.join(result_dir, "original_crit.csv"), header=None)
 null_crit = pd.DataFrame()
 
@@ -28,6 +35,7 @@ null_crit.columns = [f"{j+1}_comp" for j in range(null_crit.shape[1])]
 null_crit.to_csv(os.path.join(result_dir, "null_crit_total.csv"))
 
 # === compute p-values, z-scores ===
+profiler.mark("p-values")
 ori = ori_crit.values[0]
 null_mean = null_crit.mean().values
 null_std = null_crit.std().values
@@ -36,6 +44,7 @@ p_vals = [(ori[j] < null_crit.iloc[:, j]).mean() for j in range(len(ori))]
 p_fdr = fdrcorrection(p_vals)[1]
 
 # === save results ===
+profiler.mark("save")
 summary_df = pd.DataFrame({
     "original": ori,
     "null_mean": null_mean,
@@ -47,6 +56,7 @@ summary_df = pd.DataFrame({
 summary_df.to_csv(os.path.join(perm_summary_dir, "3block_perm_result_summary.csv"))
 
 # === plot histograms ===
+profiler.mark("plotting")
 for j in range(len(ori)):
     plt.figure(figsize=(7, 5))
     plt.hist(null_crit.iloc[:, j], bins=30, alpha=0.7, label=f'p = {p_vals[j]:.4f}')
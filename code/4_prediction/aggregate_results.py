@@ -0,0 +1,319 @@
+import os
+import csv
+import argparse
+import numpy as np
+import pandas as pd
+
+import prediction_utils as pu
+
+# ---------------------------------------------------------
+# Streaming aggregation of per-seed metrics and feature importances
+#
+# Every metrics_{n}.csv / feature_importance_{n}.csv is read once with the
+# csv module and folded into running statistics per metric and feature:
+# count, mean and M2 (Welford), min/max and a 1024-bin histogram whose range
+# doubles when a value falls outside it (percentiles are read from it, to
+# within one bin width). Importance ranks get the same moments plus a top-k
+# count, and the rank sums give Kendall's W. The per-outcome state file keeps
+# only these accumulators and the file mtimes of the seeds already read:
+# later runs read new seeds only, and rebuild from the files when a seed was
+# rewritten or removed (accumulated values cannot be subtracted again).
+# Non-finite values (e.g. an inf Optimal_Threshold) are counted, not averaged.
+# ---------------------------------------------------------
+
+percentiles = [2.5, 25, 50, 75, 97.5]
+top_k = 10
+n_bins = 1024
+
+
+def read_metrics_file(path):
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        names = next(reader)
+        values = [float(v) for v in next(reader)]
+    return names, values
+
+
+def read_importance_file(path):
+    with open(path, newline="") as f:
+        reader = csv.DictReader(f)
+        return {row["Feature"]: float(row["Importance"]) for row in reader}
+
+
+# ---------------------------------------------------------
+# Class: running statistics of one value per name and seed
+# ---------------------------------------------------------
+class RunningStats:
+    fields = ["count", "mean", "m2", "min", "max", "nonfinite", "lo", "width", "hist"]
+
+    def __init__(self, n_names):
+        self.count = np.zeros(n_names)
+        self.mean = np.zeros(n_names)
+        self.m2 = np.zeros(n_names)
+        self.min = np.full(n_names, np.inf)
+        self.max = np.full(n_names, -np.inf)
+        self.nonfinite = np.zeros(n_names)
+        self.lo = np.zeros(n_names)
+        self.width = np.zeros(n_names)  # 0: histogram not started
+        self.hist = np.zeros((n_names, n_bins))
+
+    @classmethod
+    def from_state(cls, state, prefix):
+        stats = cls(0)
+        for field in cls.fields:
+            setattr(stats, field, state[f"{prefix}_{field}"])
+        return stats
+
+    def to_state(self, prefix):
+        return {f"{prefix}_{field}": getattr(self, field) for field in self.fields}
+
+    def add(self, values):
+        # values: one seed, one value per name (NaN = not reported by this seed)
+        values = np.asarray(values, dtype=float)
+        self.nonfinite += np.isinf(values)
+        idx = np.flatnonzero(np.isfinite(values))
+        x = values[idx]
+
+        self.count[idx] += 1
+        delta = x - self.mean[idx]
+        self.mean[idx] += delta / self.count[idx]
+        self.m2[idx] += delta * (x - self.mean[idx])
+        self.min[idx] = np.minimum(self.min[idx], x)
+        self.max[idx] = np.maximum(self.max[idx], x)
+
+        for i, value in zip(idx, x):
+            self._grow(i, value)
+        bins = np.minimum(((x - self.lo[idx]) / self.width[idx]).astype(int), n_bins - 1)
+        self.hist[idx, bins] += 1
+
+    def _grow(self, i, value):
+        if self.width[i] == 0:
+            self.lo[i], self.width[i] = value, max(abs(value), 1e-12) / n_bins
+            return
+        # Double the bin width (merging bin pairs) until value is inside the range
+        while value >= self.lo[i] + n_bins * self.width[i] or value < self.lo[i]:
+            merged = self.hist[i, 0::2] + self.hist[i, 1::2]
+            self.hist[i] = 0
+            if value < self.lo[i]:
+                self.hist[i, n_bins // 2:] = merged
+                self.lo[i] -= n_bins * self.width[i]
+            else:
+                self.hist[i, :n_bins // 2] = merged
+            self.width[i] *= 2
+
+    def sd(self):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.count > 1, np.sqrt(self.m2 / (self.count - 1)), np.nan)
+
+    def percentile(self, q):
+        cumulative = np.cumsum(self.hist, axis=1)
+        target = q / 100 * self.count
+        result = np.full(len(self.count), np.nan)
+        for i in np.flatnonzero(self.count > 0):
+            b = np.searchsorted(cumulative[i], target[i])
+            b = min(b, n_bins - 1)
+            below = cumulative[i, b - 1] if b > 0 else 0.0
+            fraction = (target[i] - below) / self.hist[i, b] if self.hist[i, b] > 0 else 0.5
+            value = self.lo[i] + (b + fraction) * self.width[i]
+            result[i] = min(max(value, self.min[i]), self.max[i])
+        return result
+
+
+# ---------------------------------------------------------
+# Function: state file (accumulators + mtimes of the seeds read)
+# ---------------------------------------------------------
+def empty_state(metric_names, features):
+    state = {
+        "seeds": np.zeros(0, dtype=np.int64),
+        "mtimes": np.zeros((0, 2)),  # metrics_{n}.csv, feature_importance_{n}.csv
+        "metric_names": np.array(metric_names, dtype=str),
+        "features": np.array(features, dtype=str),
+        "rank_sum": np.zeros(len(features)),
+        "rank_top": np.zeros(len(features)),
+    }
+    state.update(RunningStats(len(metric_names)).to_state("metric"))
+    state.update(RunningStats(len(features)).to_state("importance"))
+    state.update(RunningStats(len(features)).to_state("rank"))
+    return state
+
+
+def load_state(path):
+    if not os.path.exists(path):
+        return None
+    with np.load(path, allow_pickle=False) as data:
+        if "mtimes" not in data.files:
+            return None  # state of an older version of this script: rebuild
+        return {key: data[key] for key in data.files}
+
+
+def save_state(path, state):
+    tmp_path = path + ".tmp.npz"
+    np.savez_compressed(tmp_path, **state)
+    os.replace(tmp_path, path)
+
+
+def seed_mtimes(metrics_files, importance_files, seeds):
+    return np.array([[os.path.getmtime(metrics_files[n]), os.path.getmtime(importance_files[n])] for n in seeds])
+
+
+def changed_seeds(state, metrics_files, importance_files):
+    # Seeds read before whose files were rewritten or removed since
+    changed = []
+    for n, mtimes in zip(state["seeds"].tolist(), state["mtimes"]):
+        if n not in metrics_files or n not in importance_files:
+            changed.append(n)
+        elif not np.array_equal(seed_mtimes(metrics_files, importance_files, [n])[0], mtimes):
+            changed.append(n)
+    return changed
+
+
+def update_state(state, save_dir, model_type):
+    metrics_files = pu.list_seed_files(pu.output_dir(save_dir, model_type, "metrics"), "metrics")
+    importance_files = pu.list_seed_files(pu.output_dir(save_dir, model_type, "feature_importance"), "feature_importance")
+    available = sorted(n for n in metrics_files if n in importance_files)
+
+    if state is not None:
+        changed = changed_seeds(state, metrics_files, importance_files)
+        if changed:
+            print(f"{model_type}: {len(changed)} seeds rewritten or removed since the last run - rebuilding")
+            state = None
+
+    seen = set() if state is None else set(state["seeds"].tolist())
+    new_seeds = [n for n in available if n not in seen]
+    if not new_seeds:
+        return state, 0
+
+    if state is None:
+        names, _ = read_metrics_file(metrics_files[new_seeds[0]])
+        state = empty_state(names, sorted(read_importance_file(importance_files[new_seeds[0]])))
+    metric_names, features = list(state["metric_names"]), list(state["features"])
+    metric_stats = RunningStats.from_state(state, "metric")
+    importance_stats = RunningStats.from_state(state, "importance")
+    rank_stats = RunningStats.from_state(state, "rank")
+
+    for n in new_seeds:
+        row = dict(zip(*read_metrics_file(metrics_files[n])))
+        importance = read_importance_file(importance_files[n])
+        values = np.array([importance.get(feature, np.nan) for feature in features])
+
+        metric_stats.add([row.get(name, np.nan) for name in metric_names])
+        importance_stats.add(values)
+        # Rank 1 = most important feature of the seed
+        ranks = pd.Series(values).rank(ascending=False, method="average").values
+        rank_stats.add(ranks)
+        state["rank_sum"] += np.nan_to_num(ranks)
+        state["rank_top"] += ranks <= top_k
+
+    state.update(metric_stats.to_state("metric"))
+    state.update(importance_stats.to_state("importance"))
+    state.update(rank_stats.to_state("rank"))
+    state["seeds"] = np.concatenate([state["seeds"], np.array(new_seeds, dtype=np.int64)])
+    state["mtimes"] = np.vstack([state["mtimes"], seed_mtimes(metrics_files, importance_files, new_seeds)])
+    return state, len(new_seeds)
+
+
+# ---------------------------------------------------------
+# Function: summary statistics from the state
+# ---------------------------------------------------------
+def describe(stats, names, kind, model_type):
+    summary = pd.DataFrame({
+        "Model_Type": model_type,
+        "Kind": kind,
+        "Name": names,
+        "N_Seeds": stats.count.astype(int),
+        "N_Nonfinite": stats.nonfinite.astype(int),
+        "Mean": np.where(stats.count > 0, stats.mean, np.nan),
+        "SD": stats.sd(),
+    })
+    for q in percentiles:
+        summary[f"P{q:g}"] = stats.percentile(q)
+    return summary
+
+
+def kendall_w(state):
+    # Kendall's coefficient of concordance of the importance ranks across seeds
+    n_seeds, n_features = len(state["seeds"]), len(state["features"])
+    if n_seeds < 2:
+        return np.nan
+    rank_sums = state["rank_sum"]
+    s = ((rank_sums - rank_sums.mean()) ** 2).sum()
+    return 12 * s / (n_seeds ** 2 * (n_features ** 3 - n_features))
+
+
+def summarize_outcome(base_dir, outcome_var, rebuild=False, write_csv=False):
+    save_dir = os.path.join(base_dir, outcome_var)
+    aggregate_dir = os.path.join(save_dir, "aggregate")
+    os.makedirs(aggregate_dir, exist_ok=True)
+
+    tables = []
+    for model_type in pu.model_types:
+        state_path = os.path.join(aggregate_dir, f"{model_type}_state.npz")
+        state = None if rebuild else load_state(state_path)
+        state, n_new = update_state(state, save_dir, model_type)
+        if state is None:
+            if os.path.exists(state_path):
+                os.remove(state_path)
+            continue
+        if n_new:
+            save_state(state_path, state)
+
+        metrics = describe(RunningStats.from_state(state, "metric"), state["metric_names"], "metric", model_type)
+        features = describe(RunningStats.from_state(state, "importance"), state["features"], "feature", model_type)
+        rank_stats = RunningStats.from_state(state, "rank")
+        features["Mean_Rank"] = np.where(rank_stats.count > 0, rank_stats.mean, np.nan)
+        features["SD_Rank"] = rank_stats.sd()
+        features[f"Top{top_k}_Frequency"] = state["rank_top"] / len(state["seeds"])
+        features["Kendall_W"] = kendall_w(state)
+
+        tables += [metrics, features]
+        print(f"{outcome_var} / {model_type}: {n_new} new seeds, {len(state['seeds'])} total, "
+              f"Kendall's W = {kendall_w(state):.3f}")
+
+    if not tables:
+        return None
+
+    summary = pd.concat(tables, ignore_index=True)
+    save_summary(os.path.join(aggregate_dir, "seed_summary.npz"), summary)
+    if write_csv:
+        summary.to_csv(os.path.join(aggregate_dir, "seed_summary.csv"), index=False)
+    return summary
+
+
+# ---------------------------------------------------------
+# Function: columnar summary file (one array per column)
+# ---------------------------------------------------------
+def save_summary(path, summary):
+    columns = {}
+    for column in summary.columns:
+        values = summary[column].values
+        columns[column] = values.astype(str) if values.dtype == object else values
+    tmp_path = path + ".tmp.npz"
+    np.savez_compressed(tmp_path, **columns)
+    os.replace(tmp_path, path)
+
+
+def load_summary(path):
+    with np.load(path, allow_pickle=False) as data:
+        return pd.DataFrame({key: data[key] for key in data.files})
+
+
+def find_outcomes(base_dir):
+    return sorted(
+        entry.name for entry in os.scandir(base_dir)
+        if entry.is_dir() and any(os.path.isdir(pu.output_dir(entry.path, m, "metrics")) for m in pu.model_types)
+    )
+
+
+# ---------------------------------------------------------
+# Main
+# ---------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Aggregate per-seed metrics and feature importances")
+    parser.add_argument("--base-dir", default="4_prediction/")
+    parser.add_argument("--outcomes", nargs="*", help="default: every outcome folder with *_metrics")
+    parser.add_argument("--rebuild", action="store_true", help="ignore the saved state and re-read every seed")
+    parser.add_argument("--csv", action="store_true", help="also write aggregate/seed_summary.csv")
+    args = parser.parse_args()
+
+    for outcome_var in args.outcomes or find_outcomes(args.base_dir):
+        summarize_outcome(args.base_dir, outcome_var, rebuild=args.rebuild, write_csv=args.csv)
@@ -0,0 +1,195 @@
+import os
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+import prediction_utils as pu
+
+# ---------------------------------------------------------
+# Vectorized classification metrics for many seeds at once
+#
+# pu.classification_metrics evaluates one prediction vector with roc_curve,
+# confusion_matrix, roc_auc_score and average_precision_score. Here the
+# predictions of all seeds are one (seeds x subjects) array: each row is
+# sorted once, cumulative TP/FP counts at the distinct scores give the ROC
+# and PR curves, and AUROC, AP, the Youden threshold and the thresholded
+# metrics of every seed follow from array operations. The definitions are
+# those of pu.classification_metrics (scikit-learn):
+#   - ROC points as roc_curve(drop_intermediate=True), with the (0, 0) point
+#     at threshold inf; AUROC is the trapezoid area over these points.
+#   - AP = sum over distinct thresholds of (R_k - R_k-1) * P_k.
+#   - Youden threshold = first maximum of tpr - fpr over the ROC points;
+#     class = score >= threshold.
+#
+#   python 4_prediction/evaluation_kernel.py --outcome suicidal_behav_y_base --model-type main --check
+# re-scores the test set with every saved final_model_{n}.json and
+# evaluates all seeds in one pass.
+# ---------------------------------------------------------
+
+
+# ---------------------------------------------------------
+# Function: sorted curves
+# ---------------------------------------------------------
+def _previous(values, mask):
+    # Value at the previous masked position (0 before the first), for nondecreasing non-negative rows
+    filled = np.maximum.accumulate(np.where(mask, values, 0), axis=1)
+    return np.concatenate([np.zeros((values.shape[0], 1)), filled[:, :-1]], axis=1)
+
+
+def _next(values, mask):
+    # Value at the next masked position (inf after the last), for nondecreasing rows
+    filled = np.minimum.accumulate(np.where(mask, values, np.inf)[:, ::-1], axis=1)[:, ::-1]
+    return np.concatenate([filled[:, 1:], np.full((values.shape[0], 1), np.inf)], axis=1)
+
+
+def sorted_curves(y_true, y_pred):
+    # y_true: (subjects,) 0/1 labels shared by all rows; y_pred: (seeds, subjects) scores
+    y_true = np.asarray(y_true).astype(float)
+    y_pred = np.atleast_2d(np.asarray(y_pred, dtype=float))
+    order = np.argsort(-y_pred, axis=1, kind="mergesort")
+    scores = np.take_along_axis(y_pred, order, axis=1)
+    tps = np.cumsum(y_true[order], axis=1)
+    fps = np.arange(1, y_pred.shape[1] + 1) - tps
+
+    # Last position of every run of tied scores = one ROC/PR point
+    ends = np.ones(scores.shape, dtype=bool)
+    ends[:, :-1] = scores[:, :-1] != scores[:, 1:]
+
+    # roc_curve(drop_intermediate=True) keeps the first and last points and
+    # every point where the curve changes direction
+    prev_fps, prev_tps = _previous(fps, ends), _previous(tps, ends)
+    next_fps, next_tps = _next(fps, ends), _next(tps, ends)
+    first = ends & (np.cumsum(ends, axis=1) == 1)
+    last = np.zeros(scores.shape, dtype=bool)
+    last[:, -1] = True
+    bend = (next_fps - 2 * fps + prev_fps != 0) | (next_tps - 2 * tps + prev_tps != 0)
+    roc_points = ends & (first | last | bend)
+
+    return {"scores": scores, "tps": tps, "fps": fps, "ends": ends, "roc_points": roc_points,
+            "n_pos": tps[:, -1:], "n_neg": fps[:, -1:]}
+
+
+# ---------------------------------------------------------
+# Function: metrics from the curves
+# ---------------------------------------------------------
+def auroc(curves):
+    fpr = curves["fps"] / curves["n_neg"]
+    tpr = curves["tps"] / curves["n_pos"]
+    points = curves["roc_points"]
+    prev_fpr, prev_tpr = _previous(fpr, points), _previous(tpr, points)
+    area = np.where(points, (fpr - prev_fpr) * (tpr + prev_tpr) / 2.0, 0.0)
+    return area.sum(axis=1)
+
+
+def average_precision(curves):
+    tps, fps, ends = curves["tps"], curves["fps"], curves["ends"]
+    recall = tps / curves["n_pos"]
+    precision = tps / (tps + fps)
+    return np.where(ends, (recall - _previous(recall, ends)) * precision, 0.0).sum(axis=1)
+
+
+def youden_thresholds(curves):
+    fpr = curves["fps"] / curves["n_neg"]
+    tpr = curves["tps"] / curves["n_pos"]
+    j = np.where(curves["roc_points"], tpr - fpr, -np.inf)
+    best = np.argmax(j, axis=1)
+    rows = np.arange(len(best))
+    thresholds = curves["scores"][rows, best]
+    # The (0, 0) point at threshold inf comes first and has J = 0
+    return np.where(j[rows, best] > 0, thresholds, np.inf)
+
+
+def counts_at(curves, thresholds):
+    # TP and FP of the rule score >= threshold (one threshold per row)
+    n_predicted = (curves["scores"] >= np.asarray(thresholds)[:, None]).sum(axis=1)
+    rows = np.arange(len(n_predicted))
+    index = np.maximum(n_predicted - 1, 0)
+    tp = np.where(n_predicted > 0, curves["tps"][rows, index], 0)
+    fp = np.where(n_predicted > 0, curves["fps"][rows, index], 0)
+    return tp, fp
+
+
+def classification_metrics(y_true, y_pred, prefix, thresholds=None):
+    # Batch version of pu.classification_metrics: one row per row of y_pred, same columns
+    curves = sorted_curves(y_true, y_pred)
+    if thresholds is None:
+        thresholds = youden_thresholds(curves)
+    tp, fp = counts_at(curves, thresholds)
+    n_pos, n_neg = curves["n_pos"][:, 0], curves["n_neg"][:, 0]
+    sensitivity = tp / n_pos
+    specificity = (n_neg - fp) / n_neg
+
+    return pd.DataFrame({
+        f"{prefix}_Accuracy": (tp + n_neg - fp) / (n_pos + n_neg),
+        f"{prefix}_Balanced_Accuracy": (sensitivity + specificity) / 2,
+        f"{prefix}_AUROC": auroc(curves),
+        f"{prefix}_Specificity": specificity,
+        f"{prefix}_Sensitivity": sensitivity,
+        f"{prefix}_Average_Precision": average_precision(curves),
+        f"{prefix}_Optimal_Threshold": thresholds
+    })
+
+
+# ---------------------------------------------------------
+# Function: stacked test predictions of the saved seed models
+# ---------------------------------------------------------
+def stacked_test_predictions(save_dir, model_type, n_threads):
+    import xgboost as xgb
+
+    _, X_test, _, y_test = pu.load_scaled_data(save_dir, classification=True)
+    model_files = pu.list_seed_files(pu.output_dir(save_dir, model_type, "models"), "final_model", "json")
+    if not model_files:
+        raise FileNotFoundError(f"No final_model_*.json in {pu.output_dir(save_dir, model_type, 'models')}")
+
+    seeds = sorted(model_files)
+    X = np.ascontiguousarray(X_test[pu.feature_columns(X_test, model_type)].values, dtype=np.float32)
+    predictions = np.empty((len(seeds), len(X)))
+    for i, n in enumerate(seeds):
+        booster = xgb.Booster(model_file=model_files[n])
+        booster.set_param({"nthread": n_threads})
+        predictions[i] = booster.inplace_predict(X)
+    return seeds, y_test.values, predictions
+
+
+def compare_saved(save_dir, model_type, seeds, metrics):
+    # Largest absolute difference to the Test_* values in metrics_{n}.csv
+    saved = pd.DataFrame(np.nan, index=metrics.index, columns=metrics.columns)
+    for n in seeds:
+        path = pu.metrics_path(save_dir, model_type, n)
+        if os.path.exists(path):
+            saved.loc[n] = pd.read_csv(path)[metrics.columns].iloc[0].values
+    return (metrics - saved).abs().max()
+
+
+# ---------------------------------------------------------
+# Main
+# ---------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate all seeds of an outcome in one vectorized pass")
+    parser.add_argument("--outcome", default="suicidal_behav_y_base")
+    parser.add_argument("--model-type", choices=pu.model_types, default="main")
+    parser.add_argument("--base-dir", default="4_prediction/")
+    parser.add_argument("--n-threads", type=int, default=os.cpu_count())
+    parser.add_argument("--check", action="store_true", help="compare with the saved metrics_{n}.csv")
+    args = parser.parse_args()
+
+    if not pu.is_classification(args.outcome):
+        raise SystemExit(f"{args.outcome} is not a classification outcome")
+    save_dir = os.path.join(args.base_dir, args.outcome)
+
+    seeds, y_test, predictions = stacked_test_predictions(save_dir, args.model_type, args.n_threads)
+    start = time.perf_counter()
+    metrics = classification_metrics(y_test, predictions, "Test")
+    metrics.index = pd.Index(seeds, name="seed")
+    print(f"{len(seeds)} seeds x {predictions.shape[1]} subjects evaluated in "
+          f"{1000 * (time.perf_counter() - start):.1f} ms")
+
+    out_path = os.path.join(save_dir, f"{args.model_type}_evaluation.csv")
+    metrics.to_csv(out_path)
+    print(metrics.describe().loc[["mean", "std"]].T.to_string())
+    print(f"Saved to {out_path}")
+
+    if args.check:
+        print("Max |difference| to saved metrics:")
+        print(compare_saved(save_dir, args.model_type, seeds, metrics).to_string())
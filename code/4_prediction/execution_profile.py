@@ -0,0 +1,66 @@
+import os
+import shutil
+
+# ---------------------------------------------------------
+# Execution profile shared by the xgboost_*_for_slurm.py scripts
+#
+# configure() must run before numpy/pandas/xgboost are imported, because the
+# BLAS thread pools read their environment variables at load time. Only the
+# standard library is imported here for that reason.
+#
+# On CPU the grid search is parallelized across candidates/folds (loky
+# workers, each fitting a small single-threaded or few-threaded model) and the
+# final 500-tree fit uses all cores. BLAS is pinned to one thread, since the
+# numerical work is done by XGBoost's own OpenMP pool.
+# ---------------------------------------------------------
+
+blas_env_vars = ["OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "BLIS_NUM_THREADS",
+                 "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS"]
+
+
+def detect_cores():
+    # Explicit budget (e.g. from run_matrix.py) > Slurm allocation > CPU affinity
+    for var in ["ABCD_GPS_NUM_CPUS", "SLURM_CPUS_PER_TASK"]:
+        if os.environ.get(var, "").isdigit() and int(os.environ[var]) > 0:
+            return int(os.environ[var])
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def detect_device(prefer_gpu):
+    device = os.environ.get("ABCD_GPS_DEVICE")
+    if device:
+        return device
+    if not prefer_gpu:
+        return "cpu"
+    visible = os.environ.get("CUDA_VISIBLE_DEVICES")
+    if visible is not None:
+        return "cuda" if visible not in ("", "-1") else "cpu"
+    return "cuda" if shutil.which("nvidia-smi") else "cpu"
+
+
+def configure(prefer_gpu=False, verbose=True):
+    n_cores = detect_cores()
+    device = detect_device(prefer_gpu)
+
+    for var in blas_env_vars:
+        os.environ[var] = "1"
+    os.environ.setdefault("OMP_NUM_THREADS", str(n_cores))
+
+    profile = {"n_cores": n_cores, "device": device}
+    if verbose:
+        print(f"Execution profile: {n_cores} cores, device={device}, BLAS threads=1")
+    return profile
+
+
+def parallel_layout(profile, n_fits, verbose=True, stage="grid search"):
+    # Returns (n_jobs, n_threads): concurrent fits x XGBoost threads per fit
+    if profile["device"] != "cpu":
+        n_jobs, n_threads = 1, profile["n_cores"]
+    else:
+        n_jobs = max(1, min(profile["n_cores"], n_fits))
+        n_threads = max(1, profile["n_cores"] // n_jobs)
+    if verbose:
+        print(f"Layout for {stage}: {n_fits} fits -> {n_jobs} parallel jobs x {n_threads} threads")
+    return n_jobs, n_threads
@@ -0,0 +1,286 @@
+import os
+import argparse
+import multiprocessing
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from sklearn.model_selection import train_test_split, KFold, ParameterGrid
+from sklearn.preprocessing import StandardScaler
+
+import prediction_utils as pu
+
+# ---------------------------------------------------------
+# Multi-outcome training over one shared design matrix
+#
+# The GPS + covariate design (32 GPS, one-hot encoded covariates) is built
+# once for all outcomes instead of once per preprocessing run. Two modes:
+#   - per-outcome (default): each outcome is split, scaled, tuned and trained
+#     with the split, scaling and model settings of preprocessing_*.py +
+#     xgboost_*_for_slurm.py, in a worker pool that reads the design and all
+#     targets from shared memory.
+#   - --multi-output: the regression outcomes are fitted jointly with
+#     XGBoost multi-output trees on their complete cases, with one grid search.
+#     X_train is quantized once per feature set (QuantileDMatrix); the fold
+#     matrices of the 5-fold CV reuse its bin cuts (ref=), and all grid points,
+#     seeds and the final fit train on them with xgb.train. The CV predictions
+#     are those of the best grid point's fold models, which are the models
+#     cross_val_predict would refit. Binary outcomes keep the per-outcome
+#     path, since roc_auc tuning does not apply to a joint multi-label model.
+# The design is not the per-script one. Subjects and row order come from the
+# GPS-side merge of preprocessing_suicidal_behav_y_base.py;
+# preprocessing_nihtbx_*.py left-merges onto the subject list instead, so
+# regression splits differ from that script. Covariates are one-hot encoded
+# once over all subjects, not per outcome after dropping missing values, so
+# an outcome can have dummy columns that its own preprocessing run would drop.
+# Results therefore go to their own root, 4_prediction/shared_design/ by
+# default, in the per-outcome layout (<outcome>/X_train_scaled.csv,
+# {model_type}_models, ...), so they never overwrite or mix with the seeds of
+# preprocessing_*.py + xgboost_*_for_slurm.py. The other tools read them with
+# --base-dir 4_prediction/shared_design/ (4_prediction/shared_design_multioutput/
+# with --multi-output, whose regression models are joint ones).
+# ---------------------------------------------------------
+
+default_base_dir = "4_prediction/shared_design/"
+default_multi_output_dir = "4_prediction/shared_design_multioutput/"
+
+cov_list = ["age", "high.educ", "income", "race.ethnicity", "married", "abcd_site"]
+categorical_vars = cov_list[3:6]
+
+exclude_vars = [
+    'nihtbx_cardsort_uncorrected_2yr',
+    'nihtbx_list_uncorrected_2yr',
+    'nihtbx_fluidcomp_uncorrected_2yr',
+    'nihtbx_totalcomp_uncorrected_2yr'
+]
+
+
+# ---------------------------------------------------------
+# Function: shared design matrix
+# ---------------------------------------------------------
+def build_design(data_dir, targets_file, demo_file, gps_file):
+    df_targets = pd.read_csv(os.path.join(data_dir, targets_file))
+    demo = pd.read_csv(os.path.join(data_dir, demo_file))
+    gps_eur = pd.read_csv(os.path.join(data_dir, gps_file))
+
+    gps_eur = gps_eur[gps_eur["ethnic_g"] == "EUR"]
+    gps_eur = gps_eur[gps_eur["set"] == "test"]
+    gps_eur_list = gps_eur.columns[4:36].tolist()
+
+    data = (
+        gps_eur[["subjectkey"] + gps_eur_list]
+        .merge(demo[["subjectkey"] + cov_list], on="subjectkey", how="left")
+        .merge(df_targets, on="subjectkey", how="left")
+    )
+    design = pd.get_dummies(data[gps_eur_list + cov_list], columns=categorical_vars, drop_first=True)
+    print(f"Shared design: {design.shape[0]} subjects x {design.shape[1]} features")
+    return data["subjectkey"], design.astype(float), df_targets.drop(columns=["subjectkey"]).columns, data
+
+
+def default_outcomes(target_columns):
+    cbcl_vars = [c for c in target_columns if c.startswith('cbcl')]
+    nihtbx_vars = [c for c in target_columns if c.startswith('nihtbx') and c not in exclude_vars]
+    return [c for c in pu.discrete_y_vars if c in target_columns] + cbcl_vars + nihtbx_vars
+
+
+def split_indices(y, classification, test_size=0.2, bins=10):
+    # Same splits as split_data_for_binary_classification / split_data_with_matched_distribution
+    rows = np.flatnonzero(~np.isnan(y))
+    strata = y[rows] if classification else pd.qcut(y[rows], q=bins, duplicates='drop')
+    train_rows, test_rows = train_test_split(rows, test_size=test_size, random_state=42, stratify=strata)
+    return train_rows, test_rows
+
+
+def scale_split(X, train_rows, test_rows):
+    scaler = StandardScaler()
+    return scaler.fit_transform(X[train_rows]), scaler.transform(X[test_rows]), scaler
+
+
+def save_split(save_dir, outcome_var, columns, subjectkeys, train_rows, test_rows,
+               X_train, X_test, y_train, y_test, feature_scaler, outcome_scaler):
+    os.makedirs(save_dir, exist_ok=True)
+    pd.DataFrame({"subjectkey": subjectkeys[train_rows]}).to_csv(os.path.join(save_dir, "train_subjectkeys.csv"), index=False)
+    pd.DataFrame({"subjectkey": subjectkeys[test_rows]}).to_csv(os.path.join(save_dir, "test_subjectkeys.csv"), index=False)
+    pd.DataFrame(X_train, columns=columns).to_csv(os.path.join(save_dir, "X_train_scaled.csv"), index=False)
+    pd.DataFrame(X_test, columns=columns).to_csv(os.path.join(save_dir, "X_test_scaled.csv"), index=False)
+    pd.Series(y_train, name=outcome_var).to_csv(os.path.join(save_dir, "y_train_scaled.csv"), index=False)
+    pd.Series(y_test, name=outcome_var).to_csv(os.path.join(save_dir, "y_test_scaled.csv"), index=False)
+    pu.save_scaler_params(os.path.join(save_dir, "scaler_params.json"), outcome_var, categorical_vars,
+                          columns, feature_scaler, outcome_scaler)
+
+
+# ---------------------------------------------------------
+# Per-outcome mode: shared-data worker pool
+# ---------------------------------------------------------
+_worker = {}
+
+
+def _init_worker(X_spec, Y_spec, subjectkeys, columns, outcomes, settings):
+    _worker["X_shm"], _worker["X"] = pu.attach_array(X_spec)
+    _worker["Y_shm"], _worker["Y"] = pu.attach_array(Y_spec)
+    _worker["subjectkeys"] = subjectkeys
+    _worker["columns"] = columns
+    _worker["outcomes"] = outcomes
+    _worker.update(settings)
+
+
+def _train_outcome(outcome_idx):
+    outcome_var = _worker["outcomes"][outcome_idx]
+    classification = pu.is_classification(outcome_var)
+    X, y = _worker["X"], _worker["Y"][:, outcome_idx]
+    columns = _worker["columns"]
+    save_dir = os.path.join(_worker["base_dir"], outcome_var)
+
+    train_rows, test_rows = split_indices(y, classification)
+    X_train, X_test, feature_scaler = scale_split(X, train_rows, test_rows)
+    outcome_scaler = StandardScaler().fit(y[train_rows].reshape(-1, 1))
+    if classification:
+        y_train, y_test = y[train_rows].astype(int), y[test_rows].astype(int)
+    else:
+        y_train = outcome_scaler.transform(y[train_rows].reshape(-1, 1)).ravel()
+        y_test = outcome_scaler.transform(y[test_rows].reshape(-1, 1)).ravel()
+
+    save_split(save_dir, outcome_var, columns, _worker["subjectkeys"], train_rows, test_rows,
+               X_train, X_test, y_train, y_test, feature_scaler, outcome_scaler)
+
+    for model_type in _worker["model_types"]:
+        feature_names = pu.selected_columns if model_type == "baseline" else columns
+        feature_idx = [columns.index(c) for c in feature_names]
+        for experiment_number in _worker["seeds"]:
+            final_model, best_params, metrics = pu.fit_and_evaluate(
+                X_train[:, feature_idx], y_train, X_test[:, feature_idx], y_test, classification, experiment_number,
+                n_threads=_worker["n_threads"], feature_names=feature_names,
+                cache_dir=os.path.join(save_dir, "tuning_cache")
+            )
+            pu.save_seed_outputs(save_dir, model_type, experiment_number, final_model, best_params, metrics,
+                                  feature_names)
+    return outcome_var
+
+
+def train_per_outcome(base_dir, subjectkeys, design, Y, outcomes, model_types, seeds, n_jobs, threads_per_job):
+    X_shm, X_spec = pu.share_array(np.ascontiguousarray(design.values))
+    Y_shm, Y_spec = pu.share_array(np.ascontiguousarray(Y))
+    settings = {"base_dir": base_dir, "model_types": model_types, "seeds": seeds, "n_threads": threads_per_job}
+    try:
+        ctx = multiprocessing.get_context("spawn")
+        init_args = (X_spec, Y_spec, subjectkeys.values, list(design.columns), outcomes, settings)
+        with ctx.Pool(n_jobs, initializer=_init_worker, initargs=init_args) as pool:
+            for done, outcome_var in enumerate(pool.imap_unordered(_train_outcome, range(len(outcomes))), 1):
+                print(f"{outcome_var} completed ({done} / {len(outcomes)})")
+    finally:
+        for shm in (X_shm, Y_shm):
+            shm.close()
+            shm.unlink()
+
+
+# ---------------------------------------------------------
+# Multi-output mode: joint regression over complete cases
+# ---------------------------------------------------------
+def quantize_folds(X, Y, folds, n_threads):
+    # One quantized training set per feature set; the CV fold matrices reuse its bin cuts
+    dtrain = xgb.QuantileDMatrix(X, label=Y, nthread=n_threads)
+    fold_data = [(xgb.QuantileDMatrix(X[fit_rows], label=Y[fit_rows], ref=dtrain, nthread=n_threads), X[val_rows])
+                 for fit_rows, val_rows in folds]
+    return dtrain, fold_data
+
+
+def select_params(fold_data, folds, Y, base_params, n_rounds=50):
+    # Grid search on the mean CV MSE (GridSearchCV with neg_mean_squared_error, first best on ties)
+    best_mse, best_params, best_cv_pred = np.inf, None, None
+    for params in ParameterGrid(pu.param_grid):
+        Y_cv_pred = np.empty_like(Y)
+        for (dfit, X_val), (_, val_rows) in zip(fold_data, folds):
+            booster = xgb.train({**base_params, **params}, dfit, num_boost_round=n_rounds)
+            Y_cv_pred[val_rows] = booster.inplace_predict(X_val).reshape(len(val_rows), -1)
+        mse = np.mean([np.mean((Y[val_rows] - Y_cv_pred[val_rows]) ** 2) for _, val_rows in folds])
+        if mse < best_mse:
+            best_mse, best_params, best_cv_pred = mse, params, Y_cv_pred
+    return best_params, best_cv_pred
+
+
+def weight_importances(booster, n_features):
+    # Normalized split counts, as feature_importances_ with importance_type="weight"
+    scores = booster.get_score(importance_type="weight")
+    importances = np.array([scores.get(f"f{i}", 0.0) for i in range(n_features)])
+    return importances / importances.sum() if importances.sum() > 0 else importances
+
+
+def train_multi_output(base_dir, subjectkeys, design, Y, outcomes, model_types, seeds, n_threads, n_estimators=500):
+    X = design.values
+    columns = list(design.columns)
+    complete = np.flatnonzero(~np.isnan(Y).any(axis=1))
+    strata = pd.qcut(Y[complete, 0], q=10, duplicates='drop')
+    train_rows, test_rows = train_test_split(complete, test_size=0.2, random_state=42, stratify=strata)
+    print(f"Multi-output regression: {len(outcomes)} targets, {len(complete)} complete cases")
+
+    X_train, X_test, feature_scaler = scale_split(X, train_rows, test_rows)
+    outcome_scaler = StandardScaler().fit(Y[train_rows])
+    Y_train = outcome_scaler.transform(Y[train_rows])
+    Y_test = outcome_scaler.transform(Y[test_rows])
+
+    # Every outcome gets the joint split in its own folder, as the per-outcome tools expect
+    for j, outcome_var in enumerate(outcomes):
+        target_scaler = StandardScaler().fit(Y[train_rows, j:j + 1])
+        save_split(os.path.join(base_dir, outcome_var), outcome_var, columns, subjectkeys.values, train_rows, test_rows,
+                   X_train, X_test, Y_train[:, j], Y_test[:, j], feature_scaler, target_scaler)
+
+    folds = list(KFold(n_splits=5).split(X_train))  # the unshuffled folds of cv=5 for regression
+    for model_type in model_types:
+        feature_names = pu.feature_columns(design, model_type)
+        feature_idx = [columns.index(c) for c in feature_names]
+        dtrain, fold_data = quantize_folds(X_train[:, feature_idx], Y_train, folds, n_threads)
+
+        for experiment_number in seeds:
+            base_params = {"tree_method": "hist", "objective": "reg:squarederror", "multi_strategy": "multi_output_tree",
+                           "seed": experiment_number, "nthread": n_threads}
+            best_params, Y_cv_pred = select_params(fold_data, folds, Y_train, base_params)
+            final_model = xgb.train({**base_params, **best_params}, dtrain, num_boost_round=n_estimators)
+            Y_test_pred = final_model.inplace_predict(X_test[:, feature_idx]).reshape(len(test_rows), -1)
+            importances = weight_importances(final_model, len(feature_names))
+
+            # The joint model is saved in each outcome's folder; target_index is its prediction column
+            for j, outcome_var in enumerate(outcomes):
+                metrics = {**pu.regression_metrics(Y_train[:, j], Y_cv_pred[:, j], "Valid"),
+                           **pu.regression_metrics(Y_test[:, j], Y_test_pred[:, j], "Test")}
+                params_record = {"best_params": best_params, "seed": experiment_number,
+                                 "objective": base_params["objective"], "n_estimators": n_estimators,
+                                 "multi_strategy": base_params["multi_strategy"], "targets": outcomes, "target_index": j}
+                pu.write_seed_outputs(os.path.join(base_dir, outcome_var), model_type, experiment_number, final_model,
+                                      params_record, metrics, feature_names, importances)
+            print(f"Multi-output {model_type} seed {experiment_number} completed")
+
+
+# ---------------------------------------------------------
+# Main
+# ---------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train all outcomes over one shared GPS design matrix")
+    parser.add_argument("--data-dir", default=".")
+    parser.add_argument("--targets-file", default="xgb_synthetic_EUR_100.csv")
+    parser.add_argument("--demo-file", default="demo_synthetic_EUR_100.csv")
+    parser.add_argument("--gps-file", default="gps_eur_synthetic_100.csv")
+    parser.add_argument("--base-dir", help=f"output root, kept apart from the per-script results in 4_prediction/ "
+                                           f"(default: {default_base_dir}, {default_multi_output_dir} with --multi-output)")
+    parser.add_argument("--outcomes", nargs="*", help="default: discrete_y_vars + cbcl_* + nihtbx_* targets")
+    parser.add_argument("--model-types", nargs="+", choices=pu.model_types, default=pu.model_types)
+    parser.add_argument("--seeds", type=int, nargs="+", default=[1])
+    parser.add_argument("--multi-output", action="store_true", help="fit the regression outcomes jointly")
+    parser.add_argument("--n-jobs", type=int, default=os.cpu_count())
+    parser.add_argument("--threads-per-job", type=int, default=1)
+    args = parser.parse_args()
+
+    subjectkeys, design, target_columns, data = build_design(args.data_dir, args.targets_file, args.demo_file, args.gps_file)
+    outcomes = args.outcomes or default_outcomes(target_columns)
+    base_dir = args.base_dir or (default_multi_output_dir if args.multi_output else default_base_dir)
+
+    per_outcome = outcomes
+    if args.multi_output:
+        regression_outcomes = [o for o in outcomes if not pu.is_classification(o)]
+        per_outcome = [o for o in outcomes if pu.is_classification(o)]
+        if regression_outcomes:
+            train_multi_output(base_dir, subjectkeys, design, data[regression_outcomes].values.astype(float),
+                               regression_outcomes, args.model_types, args.seeds, args.n_jobs * args.threads_per_job)
+
+    if per_outcome:
+        train_per_outcome(base_dir, subjectkeys, design, data[per_outcome].values.astype(float),
+                          per_outcome, args.model_types, args.seeds, args.n_jobs, args.threads_per_job)
+    print("Multi-outcome training completed successfully.")
@@ -0,0 +1,112 @@
+import os
+import argparse
+import multiprocessing
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import RepeatedStratifiedKFold
+
+import prediction_utils as pu
+
+# ---------------------------------------------------------
+# Repeated nested cross-validation
+#
+# The fixed 80/20 split of preprocessing is replaced by repeated stratified
+# outer folds over all subjects (quantile bins of the outcome for regression,
+# as in split_data_with_matched_distribution). Every outer fold runs the same
+# inner GridSearchCV(cv=5) + final fit as the training scripts. Workers read X
+# and y from shared memory, so only fold indices are sent per task.
+# ---------------------------------------------------------
+
+_worker = {}
+
+
+def _init_worker(X_spec, y_spec, classification, experiment_number, n_threads):
+    _worker["X_shm"], _worker["X"] = pu.attach_array(X_spec)
+    _worker["y_shm"], _worker["y"] = pu.attach_array(y_spec)
+    _worker["classification"] = classification
+    _worker["experiment_number"] = experiment_number
+    _worker["n_threads"] = n_threads
+
+
+def _run_outer_fold(task):
+    repeat, fold, train_idx, test_idx = task
+    X, y = _worker["X"], _worker["y"]
+
+    _, best_params, metrics = pu.fit_and_evaluate(
+        X[train_idx], y[train_idx], X[test_idx], y[test_idx],
+        _worker["classification"], _worker["experiment_number"], n_threads=_worker["n_threads"]
+    )
+    return {"Repeat": repeat, "Fold": fold, "N_Train": len(train_idx), "N_Test": len(test_idx),
+            **{f"Best_{k}": v for k, v in best_params.items()}, **metrics}
+
+
+def stratification_labels(y, classification, bins=10):
+    if classification:
+        return y
+    return pd.qcut(y, q=bins, labels=False, duplicates="drop")
+
+
+def outer_splits(y, classification, n_splits, n_repeats, random_state):
+    splitter = RepeatedStratifiedKFold(n_splits=n_splits, n_repeats=n_repeats, random_state=random_state)
+    strata = stratification_labels(y, classification)
+    for i, (train_idx, test_idx) in enumerate(splitter.split(np.zeros(len(y)), strata)):
+        yield i // n_splits + 1, i % n_splits + 1, train_idx.astype(np.int32), test_idx.astype(np.int32)
+
+
+def run_nested_cv(base_dir, outcome_var, model_type, experiment_number, n_splits, n_repeats, n_jobs, threads_per_job):
+    classification = pu.is_classification(outcome_var)
+    save_dir = os.path.join(base_dir, outcome_var)
+
+    # All subjects of the preprocessed split; trees are unaffected by the train-fitted scaling
+    X_train, X_test, y_train, y_test = pu.load_scaled_data(save_dir, classification)
+    columns = pu.feature_columns(X_train, model_type)
+    X = np.ascontiguousarray(pd.concat([X_train, X_test])[columns].values, dtype=np.float64)
+    y = np.ascontiguousarray(pd.concat([y_train, y_test]).values)
+
+    X_shm, X_spec = pu.share_array(X)
+    y_shm, y_spec = pu.share_array(y)
+    try:
+        tasks = list(outer_splits(y, classification, n_splits, n_repeats, random_state=experiment_number))
+        ctx = multiprocessing.get_context("spawn")  # no fork after OpenMP is initialized
+        init_args = (X_spec, y_spec, classification, experiment_number, threads_per_job)
+        with ctx.Pool(n_jobs, initializer=_init_worker, initargs=init_args) as pool:
+            rows = []
+            for row in pool.imap_unordered(_run_outer_fold, tasks):
+                rows.append(row)
+                print(f"Outer fold {len(rows)} / {len(tasks)} done")
+    finally:
+        for shm in (X_shm, y_shm):
+            shm.close()
+            shm.unlink()
+
+    results = pd.DataFrame(rows).sort_values(["Repeat", "Fold"])
+    metric_columns = [c for c in results.columns if c.startswith(("Valid_", "Test_"))]
+    summary = results[metric_columns].agg(["mean", "std"]).T
+    summary.columns = ["Mean", "SD"]
+
+    result_dir = os.path.join(save_dir, f"{model_type}_nested_cv")
+    os.makedirs(result_dir, exist_ok=True)
+    results.to_csv(os.path.join(result_dir, f"nested_cv_results_{experiment_number}.csv"), index=False)
+    summary.to_csv(os.path.join(result_dir, f"nested_cv_summary_{experiment_number}.csv"), index_label="Metric")
+    return results, summary
+
+
+# ---------------------------------------------------------
+# Main
+# ---------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Repeated nested cross-validation of the XGBoost pipeline")
+    parser.add_argument("experiment_number", type=int, help="seed for the outer splits and XGBoost")
+    parser.add_argument("--outcome", default="suicidal_behav_y_base")
+    parser.add_argument("--model-type", choices=pu.model_types, default="main")
+    parser.add_argument("--base-dir", default="4_prediction/")
+    parser.add_argument("--n-splits", type=int, default=5)
+    parser.add_argument("--n-repeats", type=int, default=10)
+    parser.add_argument("--n-jobs", type=int, default=os.cpu_count())
+    parser.add_argument("--threads-per-job", type=int, default=1)
+    args = parser.parse_args()
+
+    results, summary = run_nested_cv(args.base_dir, args.outcome, args.model_type, args.experiment_number,
+                                     args.n_splits, args.n_repeats, args.n_jobs, args.threads_per_job)
+    print(summary.to_string())
+    print(f"Nested CV for experiment {args.experiment_number} completed successfully.")
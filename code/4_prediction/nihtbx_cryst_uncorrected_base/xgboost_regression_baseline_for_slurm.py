@@ -1,10 +1,16 @@
 import os
-import pandas as pd
-import numpy as np
 import sys
-from sklearn.model_selection import GridSearchCV, cross_val_predict
-from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score, explained_variance_score
-from xgboost import XGBRegressor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+import execution_profile
+import stage_profiler
+
+# Detect cores/device and pin BLAS threads before numpy and xgboost are loaded
+profile = execution_profile.configure(prefer_gpu=True)
+
+from sklearn.model_selection import ParameterGrid
+import prediction_utils as pu
 
 # 실험 번호를 인자로 받기
 experiment_number = int(sys.argv[1])  # Slurm에서 전달된 번호
@@ -12,117 +18,35 @@ experiment_number = int(sys.argv[1])  # Slurm에서 전달된 번호
 # Define paths
 base_dir = "4_prediction/"
 outcome_var = "nihtbx_cryst_uncorrected_base"
+model_type = "baseline"
+profiler = stage_profiler.Profiler(outcome=outcome_var, seed=experiment_number)
 save_dir = os.path.join(base_dir, outcome_var)
-X_train_path = os.path.join(save_dir, "X_train_scaled.csv")
-X_test_path = os.path.join(save_dir, "X_test_scaled.csv")
-y_train_path = os.path.join(save_dir, "y_train_scaled.csv")
-y_test_path = os.path.join(save_dir, "y_test_scaled.csv")
 
 # Load datasets
-X_train = pd.read_csv(X_train_path)
-X_test = pd.read_csv(X_test_path)
-y_train = pd.read_csv(y_train_path).squeeze()
-y_test = pd.read_csv(y_test_path).squeeze()
-
-# Selected columns
-selected_columns = [
-    'age', 'high.educ', 'income', 'race.ethnicity_2', 'race.ethnicity_3', 'race.ethnicity_4',
-    'race.ethnicity_5', 'married_2', 'married_3', 'married_4', 'married_5', 'married_6',
-    'abcd_site_2', 'abcd_site_3', 'abcd_site_4', 'abcd_site_5', 'abcd_site_6', 'abcd_site_7',
-    'abcd_site_8', 'abcd_site_9', 'abcd_site_10', 'abcd_site_11', 'abcd_site_12', 'abcd_site_13',
-    'abcd_site_14', 'abcd_site_15', 'abcd_site_16', 'abcd_site_17', 'abcd_site_18', 'abcd_site_19',
-    'abcd_site_20', 'abcd_site_21', 'abcd_site_22'
-]
-X_train_filtered = X_train[selected_columns]
-X_test_filtered = X_test[selected_columns]
-
-# Parameters
-param_grid = {
-    "learning_rate": [0.01, 0.05],
-    "max_depth": [3, 4],
-    "min_child_weight": [1, 5],
-    "subsample": [0.8],
-    "colsample_bytree": [0.8]
-}
-
-# Define model
-xgb_model = XGBRegressor(
-    tree_method="hist",
-    device="cuda",
-    objective="reg:squarederror",
-    n_gpu=4,  # Use 4 GPUs
-    n_estimators=50,  # During Grid Search
-    seed=experiment_number  # Use experiment number as seed
-)
-
-# GridSearchCV
-grid_search = GridSearchCV(
-    estimator=xgb_model,
-    param_grid=param_grid,
-    scoring="neg_mean_squared_error",
-    cv=5,
-    verbose=0,
-    n_jobs=1
+profiler.mark("load")
+X_train, X_test, y_train, y_test = pu.load_scaled_data(save_dir, classification=False)
+feature_names = pu.feature_columns(X_train, model_type)  # demographic covariates only (pu.selected_columns)
+
+# Parallel layout: concurrent grid-search fits x XGBoost threads per fit
+search_jobs, search_threads = execution_profile.parallel_layout(profile, n_fits=len(ParameterGrid(pu.param_grid)) * 5)
+
+# GridSearchCV + cross-validated predictions (reused from the tuning cache when inputs are unchanged),
+# final model on all cores (50 trees per fit during the search, 500 for the final model) and Valid/Test metrics
+final_model, best_params, metrics = pu.fit_and_evaluate(
+    X_train[feature_names].values, y_train.values, X_test[feature_names].values, y_test.values,
+    classification=False,
+    experiment_number=experiment_number,
+    search_jobs=search_jobs,
+    n_threads=search_threads,
+    device=profile["device"],
+    feature_names=feature_names,
+    cache_dir=os.path.join(save_dir, "tuning_cache"),
+    final_threads=profile["n_cores"],
+    profiler=profiler
 )
-grid_search.fit(X_train_filtered.values, y_train.values)
-
-# Cross-Validation 성능 계산
-cv_best_model = grid_search.best_estimator_
-y_cv_pred = cross_val_predict(cv_best_model, X_train_filtered.values, y_train.values, cv=5)
-
-cv_metrics = {
-    "Valid_RMSE": np.sqrt(mean_squared_error(y_train.values, y_cv_pred)),
-    "Valid_MAE": mean_absolute_error(y_train.values, y_cv_pred),
-    "Valid_R2": r2_score(y_train.values, y_cv_pred),
-    "Valid_Explained_Variance": explained_variance_score(y_train.values, y_cv_pred),
-}
-
-# Train final model
-best_params = grid_search.best_params_
-final_model = XGBRegressor(
-    **best_params,
-    tree_method="hist",
-    device="cuda",
-    objective="reg:squarederror",
-    n_estimators=500,
-    seed=experiment_number
-)
-final_model.fit(X_train_filtered.values, y_train.values)
-
-# Save model
-model_dir = os.path.join(save_dir, "baseline_models")
-os.makedirs(model_dir, exist_ok=True)
-model_path = os.path.join(model_dir, f"final_model_{experiment_number}.json")
-final_model.save_model(model_path)
-
-# Predict on test data
-y_test_pred = final_model.predict(X_test_filtered)
-
-# Evaluate test set metrics
-test_metrics = {
-    "Test_RMSE": np.sqrt(mean_squared_error(y_test, y_test_pred)),
-    "Test_MAE": mean_absolute_error(y_test, y_test_pred),
-    "Test_R2": r2_score(y_test, y_test_pred),
-    "Test_Explained_Variance": explained_variance_score(y_test, y_test_pred)
-}
-
-# Save metrics
-metrics_dir = os.path.join(save_dir, "baseline_metrics")
-os.makedirs(metrics_dir, exist_ok=True)
-metrics_path = os.path.join(metrics_dir, f"metrics_{experiment_number}.csv")
-
-# Combine CV and Test metrics
-all_metrics = {**cv_metrics, **test_metrics}
-pd.DataFrame([all_metrics]).to_csv(metrics_path, index=False)
 
-# Save feature importance
-importance_dir = os.path.join(save_dir, "baseline_feature_importance")
-os.makedirs(importance_dir, exist_ok=True)
-feature_importance = pd.DataFrame({
-    "Feature": selected_columns,
-    "Importance": final_model.feature_importances_
-}).sort_values(by="Importance", ascending=False)
-feature_importance_path = os.path.join(importance_dir, f"feature_importance_{experiment_number}.csv")
-feature_importance.to_csv(feature_importance_path, index=False)
+# Save model, best parameters, metrics and feature importance to baseline_models, baseline_metrics, baseline_feature_importance
+pu.save_seed_outputs(save_dir, model_type, experiment_number, final_model, best_params, metrics, feature_names,
+                      profiler=profiler)
 
 print(f"Experiment {experiment_number} completed successfully.")
@@ -0,0 +1,136 @@
+import os
+import argparse
+import multiprocessing
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from sklearn.metrics import roc_auc_score, average_precision_score
+
+import prediction_utils as pu
+
+# ---------------------------------------------------------
+# Label-permutation null for Test_* metrics
+#
+# The tuned hyperparameters, seed and number of boosting rounds are read
+# from best_params_{n}.json next to final_model_{n}.json, so no grid search
+# is repeated. Each worker
+# quantizes X_train once (QuantileDMatrix) and only swaps label vectors
+# between permuted fits.
+# ---------------------------------------------------------
+
+# Threshold-free metrics that get a permutation null
+null_metrics = {
+    True: ["Test_AUROC", "Test_Average_Precision"],
+    False: ["Test_RMSE", "Test_MAE", "Test_R2", "Test_Explained_Variance"],
+}
+
+# Metrics where a lower value means a better model
+lower_is_better = ["Test_RMSE", "Test_MAE"]
+
+_worker = {}
+
+
+def _init_worker(X_train, X_test, y_train, y_test, params, num_rounds, classification):
+    _worker["dtrain"] = xgb.QuantileDMatrix(X_train, label=y_train, nthread=params["nthread"])
+    _worker["X_test"] = X_test
+    _worker["y_train"] = y_train
+    _worker["y_test"] = y_test
+    _worker["params"] = params
+    _worker["num_rounds"] = num_rounds
+    _worker["classification"] = classification
+
+
+def test_metrics(y_test, y_pred, classification):
+    if classification:
+        return {
+            "Test_AUROC": roc_auc_score(y_test, y_pred),
+            "Test_Average_Precision": average_precision_score(y_test, y_pred),
+        }
+    return pu.regression_metrics(y_test, y_pred, "Test")
+
+
+def _fit_permuted(task):
+    perm_idx, perm_seed = task
+    rng = np.random.default_rng([perm_seed, perm_idx])
+
+    dtrain = _worker["dtrain"]
+    dtrain.set_label(rng.permutation(_worker["y_train"]))
+    booster = xgb.train(_worker["params"], dtrain, num_boost_round=_worker["num_rounds"])
+    y_pred = booster.inplace_predict(_worker["X_test"])
+
+    metrics = test_metrics(_worker["y_test"], y_pred, _worker["classification"])
+    metrics["Permutation"] = perm_idx
+    return metrics
+
+
+# ---------------------------------------------------------
+# Function: empirical p-values against the permutation null
+# ---------------------------------------------------------
+def empirical_pvalues(observed, null):
+    rows = []
+    for metric, value in observed.items():
+        null_values = null[metric].values
+        if metric in lower_is_better:
+            n_extreme = (null_values <= value).sum()
+        else:
+            n_extreme = (null_values >= value).sum()
+        rows.append({
+            "Metric": metric,
+            "Observed": value,
+            "Null_Mean": null_values.mean(),
+            "Null_SD": null_values.std(ddof=1),
+            "P_Value": (n_extreme + 1) / (len(null_values) + 1),
+            "N_Permutations": len(null_values)
+        })
+    return pd.DataFrame(rows)
+
+
+def run_permutation_test(base_dir, outcome_var, model_type, experiment_number, n_perm, n_jobs, threads_per_job):
+    classification = pu.is_classification(outcome_var)
+    save_dir = os.path.join(base_dir, outcome_var)
+
+    X_train, X_test, y_train, y_test = pu.load_scaled_data(save_dir, classification)
+    columns = pu.feature_columns(X_train, model_type)
+    X_train = X_train[columns].values.astype(np.float32)
+    X_test = X_test[columns].values.astype(np.float32)
+
+    params, num_rounds = pu.load_best_params(save_dir, model_type, experiment_number)
+    params["nthread"] = threads_per_job
+
+    observed_all = pd.read_csv(pu.metrics_path(save_dir, model_type, experiment_number)).iloc[0]
+    observed = {k: observed_all[k] for k in null_metrics[classification]}
+
+    tasks = [(i, experiment_number) for i in range(1, n_perm + 1)]
+    init_args = (X_train, X_test, y_train.values, y_test.values, params, num_rounds, classification)
+    chunksize = max(1, n_perm // (n_jobs * 4))
+
+    with multiprocessing.Pool(n_jobs, initializer=_init_worker, initargs=init_args) as pool:
+        null_rows = list(pool.imap_unordered(_fit_permuted, tasks, chunksize=chunksize))
+
+    null = pd.DataFrame(null_rows).sort_values("Permutation").set_index("Permutation")
+    summary = empirical_pvalues(observed, null)
+
+    metrics_dir = pu.output_dir(save_dir, model_type, "metrics")
+    null.to_csv(os.path.join(metrics_dir, f"permutation_null_{experiment_number}.csv"))
+    summary.to_csv(os.path.join(metrics_dir, f"permutation_pvalues_{experiment_number}.csv"), index=False)
+    return summary
+
+
+# ---------------------------------------------------------
+# Main
+# ---------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Label-permutation test for a trained XGBoost seed")
+    parser.add_argument("experiment_number", type=int)
+    parser.add_argument("--outcome", default="suicidal_behav_y_base")
+    parser.add_argument("--model-type", choices=pu.model_types, default="main")
+    parser.add_argument("--base-dir", default="4_prediction/")
+    parser.add_argument("--n-perm", type=int, default=1000)
+    parser.add_argument("--n-jobs", type=int, default=os.cpu_count())
+    parser.add_argument("--threads-per-job", type=int, default=1)
+    args = parser.parse_args()
+
+    summary = run_permutation_test(args.base_dir, args.outcome, args.model_type, args.experiment_number,
+                                   args.n_perm, args.n_jobs, args.threads_per_job)
+    print(summary.to_string(index=False))
+    print(f"Permutation test for experiment {args.experiment_number} completed successfully.")
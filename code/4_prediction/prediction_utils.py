@@ -0,0 +1,300 @@
+import os
+import re
+import json
+import numpy as np
+import pandas as pd
+from multiprocessing import shared_memory
+from sklearn.metrics import accuracy_score, balanced_accuracy_score, roc_auc_score, confusion_matrix, average_precision_score
+from sklearn.metrics import roc_curve, mean_squared_error, mean_absolute_error, r2_score, explained_variance_score
+
+# ---------------------------------------------------------
+# Shared settings of the prediction scripts
+# ---------------------------------------------------------
+discrete_y_vars = ['any_psych_dx_p_base', 'adhd_p_base', 'any_dep_dx_p_base',
+                   'any_anx_dx_p_base', 'suicidal_behav_p_base', 'any_psych_dx_p_2yr',
+                   'adhd_p_2yr', 'any_dep_dx_p_2yr', 'any_anx_dx_p_2yr',
+                   'suicidal_behav_p_2yr', 'any_psych_dx_y_base', 'any_dep_dx_y_base',
+                   'any_anx_dx_y_base', 'suicidal_behav_y_base', 'any_psych_dx_y_2yr',
+                   'any_dep_dx_y_2yr', 'any_anx_dx_y_2yr', 'suicidal_behav_y_2yr']
+
+# Demographic covariates used by the baseline models
+selected_columns = [
+    'age', 'high.educ', 'income', 'race.ethnicity_2', 'race.ethnicity_3', 'race.ethnicity_4',
+    'race.ethnicity_5', 'married_2', 'married_3', 'married_4', 'married_5', 'married_6',
+    'abcd_site_2', 'abcd_site_3', 'abcd_site_4', 'abcd_site_5', 'abcd_site_6', 'abcd_site_7',
+    'abcd_site_8', 'abcd_site_9', 'abcd_site_10', 'abcd_site_11', 'abcd_site_12', 'abcd_site_13',
+    'abcd_site_14', 'abcd_site_15', 'abcd_site_16', 'abcd_site_17', 'abcd_site_18', 'abcd_site_19',
+    'abcd_site_20', 'abcd_site_21', 'abcd_site_22'
+]
+
+param_grid = {
+    "learning_rate": [0.01, 0.05],
+    "max_depth": [3, 4],
+    "min_child_weight": [1, 5],
+    "subsample": [0.8],
+    "colsample_bytree": [0.8]
+}
+
+model_types = ["baseline", "main"]
+
+
+def is_classification(outcome_var):
+    return outcome_var in discrete_y_vars
+
+
+# ---------------------------------------------------------
+# Function: load the preprocessed train/test split of an outcome
+# ---------------------------------------------------------
+def load_scaled_data(save_dir, classification):
+    X_train = pd.read_csv(os.path.join(save_dir, "X_train_scaled.csv"))
+    X_test = pd.read_csv(os.path.join(save_dir, "X_test_scaled.csv"))
+    y_train = pd.read_csv(os.path.join(save_dir, "y_train_scaled.csv")).squeeze()
+    y_test = pd.read_csv(os.path.join(save_dir, "y_test_scaled.csv")).squeeze()
+
+    # Transform outcome variable back to 0 and 1
+    if classification:
+        y_train = (y_train > 0).astype(int)
+        y_test = (y_test > 0).astype(int)
+
+    return X_train, X_test, y_train, y_test
+
+
+def feature_columns(X, model_type):
+    if model_type == "baseline":
+        return list(selected_columns)
+    return list(X.columns)
+
+
+def output_dir(save_dir, model_type, kind):
+    # kind: "models", "metrics" or "feature_importance"
+    return os.path.join(save_dir, f"{model_type}_{kind}")
+
+
+def model_path(save_dir, model_type, experiment_number):
+    return os.path.join(output_dir(save_dir, model_type, "models"), f"final_model_{experiment_number}.json")
+
+
+def metrics_path(save_dir, model_type, experiment_number):
+    return os.path.join(output_dir(save_dir, model_type, "metrics"), f"metrics_{experiment_number}.csv")
+
+
+def best_params_path(save_dir, model_type, experiment_number):
+    return os.path.join(output_dir(save_dir, model_type, "models"), f"best_params_{experiment_number}.json")
+
+
+def find_training_script(base_dir, outcome_var, model_type):
+    # e.g. xgboost_classification_main_for_slurm.py, xgboost_regression_mainmodel_for_slurm.py
+    outcome_dir = os.path.join(base_dir, outcome_var)
+    if os.path.isdir(outcome_dir):
+        for name in sorted(os.listdir(outcome_dir)):
+            if name.startswith("xgboost_") and name.endswith("_for_slurm.py") and f"_{model_type}" in name:
+                return os.path.join(outcome_dir, name)
+    return None
+
+
+def list_seed_files(directory, prefix, extension="csv"):
+    # {seed number: path} for files named {prefix}_{n}.{extension}
+    pattern = re.compile(rf"^{prefix}_(\d+)\.{extension}$")
+    seed_files = {}
+    if os.path.isdir(directory):
+        for entry in os.scandir(directory):
+            match = pattern.match(entry.name)
+            if match:
+                seed_files[int(match.group(1))] = entry.path
+    return seed_files
+
+
+# ---------------------------------------------------------
+# Function: scaler parameters written by preprocessing_*.py
+# ---------------------------------------------------------
+def save_scaler_params(path, outcome_var, categorical_vars, feature_columns, feature_scaler, outcome_scaler):
+    params = {
+        "outcome_var": outcome_var,
+        "categorical_vars": list(categorical_vars),
+        "feature_columns": list(feature_columns),
+        "feature_mean": feature_scaler.mean_.tolist(),
+        "feature_scale": feature_scaler.scale_.tolist(),
+        "outcome_mean": float(outcome_scaler.mean_[0]),
+        "outcome_scale": float(outcome_scaler.scale_[0]),
+    }
+    with open(path, "w") as f:
+        json.dump(params, f, indent=2)
+
+
+def load_scaler_params(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+# ---------------------------------------------------------
+# Function: hyperparameters of a saved seed (best_params_{n}.json)
+# ---------------------------------------------------------
+def load_best_params(save_dir, model_type, experiment_number):
+    # final_model_{n}.json only keeps the trees and the objective, so the tuned
+    # parameters come from the file written next to it by save_seed_outputs
+    path = best_params_path(save_dir, model_type, experiment_number)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} not found - rerun the training script for seed {experiment_number}")
+    with open(path) as f:
+        saved = json.load(f)
+    if "targets" in saved:
+        raise ValueError(f"{path} belongs to a joint multi-output model of {len(saved['targets'])} targets")
+
+    params = {
+        **saved["best_params"],
+        "objective": saved["objective"],
+        "tree_method": "hist",
+        "seed": saved["seed"],
+    }
+    return params, saved["n_estimators"]
+
+
+def load_target_index(save_dir, model_type, experiment_number):
+    # Prediction column of this outcome in a joint multi-output model (None: single-output model)
+    path = best_params_path(save_dir, model_type, experiment_number)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f).get("target_index")
+
+
+# ---------------------------------------------------------
+# Function: metrics as written to metrics_{n}.csv
+# ---------------------------------------------------------
+def classification_metrics(y_true, y_pred_proba, prefix):
+    y_true = np.asarray(y_true)
+
+    # Youden's J statistic
+    fpr, tpr, thresholds = roc_curve(y_true, y_pred_proba)
+    youden_index = np.argmax(tpr - fpr)
+    optimal_threshold = thresholds[youden_index]
+
+    y_pred_class = (y_pred_proba >= optimal_threshold).astype(int)
+
+    conf_matrix = confusion_matrix(y_true, y_pred_class)
+    sensitivity = conf_matrix[1, 1] / (conf_matrix[1, 0] + conf_matrix[1, 1])
+    specificity = conf_matrix[0, 0] / (conf_matrix[0, 0] + conf_matrix[0, 1])
+
+    return {
+        f"{prefix}_Accuracy": accuracy_score(y_true, y_pred_class),
+        f"{prefix}_Balanced_Accuracy": balanced_accuracy_score(y_true, y_pred_class),
+        f"{prefix}_AUROC": roc_auc_score(y_true, y_pred_proba),
+        f"{prefix}_Specificity": specificity,
+        f"{prefix}_Sensitivity": sensitivity,
+        f"{prefix}_Average_Precision": average_precision_score(y_true, y_pred_proba),
+        f"{prefix}_Optimal_Threshold": optimal_threshold
+    }
+
+
+def regression_metrics(y_true, y_pred, prefix):
+    return {
+        f"{prefix}_RMSE": np.sqrt(mean_squared_error(y_true, y_pred)),
+        f"{prefix}_MAE": mean_absolute_error(y_true, y_pred),
+        f"{prefix}_R2": r2_score(y_true, y_pred),
+        f"{prefix}_Explained_Variance": explained_variance_score(y_true, y_pred),
+    }
+
+
+# ---------------------------------------------------------
+# Function: one seed of the training scripts (grid search, CV, final fit, test)
+# ---------------------------------------------------------
+def make_estimator(classification, experiment_number, n_estimators, device="cpu", n_jobs=1, **params):
+    from xgboost import XGBClassifier, XGBRegressor
+
+    if classification:
+        return XGBClassifier(**params, tree_method="hist", device=device, objective="binary:logistic",
+                             n_estimators=n_estimators, n_jobs=n_jobs, random_state=experiment_number)
+    return XGBRegressor(**params, tree_method="hist", device=device, objective="reg:squarederror",
+                        n_estimators=n_estimators, n_jobs=n_jobs, seed=experiment_number)
+
+
+def fit_and_evaluate(X_train, y_train, X_test, y_test, classification, experiment_number,
+                     search_jobs=1, n_threads=1, device="cpu", feature_names=None, cache_dir=None,
+                     final_threads=None, profiler=None):
+    # n_threads: XGBoost threads per grid-search fit; final_threads: for the final fit (default n_threads)
+    from tuning_cache import cached_model_selection
+
+    if profiler is not None:
+        profiler.mark("grid search")
+    xgb_model = make_estimator(classification, experiment_number, 50, device, n_threads)
+    best_params, y_cv_pred = cached_model_selection(
+        estimator=xgb_model,
+        param_grid=param_grid,
+        X=X_train,
+        y=y_train,
+        scoring="roc_auc" if classification else "neg_mean_squared_error",
+        cv=5,
+        method="predict_proba" if classification else "predict",
+        feature_names=feature_names,
+        cache_dir=cache_dir,
+        n_jobs=search_jobs,
+        profiler=profiler
+    )
+
+    if profiler is not None:
+        profiler.mark("refit")
+    final_threads = n_threads if final_threads is None else final_threads
+    final_model = make_estimator(classification, experiment_number, 500, device, final_threads, **best_params)
+    final_model.fit(X_train, y_train)
+
+    if profiler is not None:
+        profiler.mark("predict")
+    if classification:
+        y_test_pred = final_model.predict_proba(X_test)[:, 1]
+        metrics = {**classification_metrics(y_train, y_cv_pred, "Valid"), **classification_metrics(y_test, y_test_pred, "Test")}
+    else:
+        y_test_pred = final_model.predict(X_test)
+        metrics = {**regression_metrics(y_train, y_cv_pred, "Valid"), **regression_metrics(y_test, y_test_pred, "Test")}
+    return final_model, best_params, metrics
+
+
+# ---------------------------------------------------------
+# Function: numpy arrays in shared memory for worker processes
+# ---------------------------------------------------------
+def share_array(array):
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[:] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+def attach_array(spec):
+    # The SharedMemory handle must stay referenced as long as the view is used
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+
+
+# ---------------------------------------------------------
+# Function: write one seed in the layout of the training scripts
+# ---------------------------------------------------------
+def save_seed_outputs(save_dir, model_type, experiment_number, final_model, best_params, metrics, feature_names,
+                      profiler=None):
+    params_record = {"best_params": best_params, "seed": experiment_number, "objective": final_model.objective,
+                     "n_estimators": final_model.n_estimators}
+    write_seed_outputs(save_dir, model_type, experiment_number, final_model, params_record, metrics, feature_names,
+                       final_model.feature_importances_, profiler)
+
+
+def write_seed_outputs(save_dir, model_type, experiment_number, model, params_record, metrics, feature_names,
+                       importances, profiler=None):
+    # model: XGBClassifier / XGBRegressor or a Booster from xgb.train
+    if profiler is not None:
+        profiler.mark("save model")
+    model_dir = output_dir(save_dir, model_type, "models")
+    os.makedirs(model_dir, exist_ok=True)
+    model.save_model(model_path(save_dir, model_type, experiment_number))
+    with open(best_params_path(save_dir, model_type, experiment_number), "w") as f:
+        json.dump(params_record, f, indent=2)
+
+    if profiler is not None:
+        profiler.mark("save metrics")
+    os.makedirs(output_dir(save_dir, model_type, "metrics"), exist_ok=True)
+    pd.DataFrame([metrics]).to_csv(metrics_path(save_dir, model_type, experiment_number), index=False)
+
+    importance_dir = output_dir(save_dir, model_type, "feature_importance")
+    os.makedirs(importance_dir, exist_ok=True)
+    feature_importance = pd.DataFrame({
+        "Feature": list(feature_names),
+        "Importance": importances
+    }).sort_values(by="Importance", ascending=False)
+    feature_importance.to_csv(os.path.join(importance_dir, f"feature_importance_{experiment_number}.csv"), index=False)
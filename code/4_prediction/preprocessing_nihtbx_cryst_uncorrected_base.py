@@ -1,20 +1,24 @@
 import os
+import sys
 import pandas as pd
 import numpy as np
-import xgboost as xgb
-from xgboost.callback import EarlyStopping
-from sklearn.model_selection import train_test_split, StratifiedKFold
+from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import StandardScaler
-from sklearn.metrics import accuracy_score, roc_auc_score, mean_squared_error
 import json
-import matplotlib.pyplot as plt
+from prediction_utils import save_scaler_params
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import stage_profiler
 
 # Directory creation function
 def create_dir_if_not_exists(dir_path):
     if not os.path.exists(dir_path):
         os.makedirs(dir_path)
 
+profiler = stage_profiler.Profiler()
+
 # Load data (replace paths with actual file paths)
+profiler.mark("load")
 df_targets = pd.read_csv("xgb_synthetic_EUR_100.csv")
 demo = pd.read_csv("demo_synthetic_EUR_100.csv")
 gps_eur = pd.read_csv("gps_eur_synthetic_100.csv")
@@ -22,6 +26,7 @@ subj_list = pd.read_csv('subjectlist_EUR_100.csv')
 subj_list.rename(columns={'x': 'subjectkey'}, inplace=True)
 
 # Define covariates and merge data
+profiler.mark("merge")
 cov_list = ["age", "high.educ", "income", "race.ethnicity", "married", "abcd_site"]
 demo_2 = demo[["subjectkey"] + cov_list]
 
@@ -77,11 +82,13 @@ data_eur_cleaned = data_eur.dropna(subset=[outcome_var])
 print(f"Shape after dropping rows with missing values in {outcome_var}: {data_eur_cleaned.shape}")
 
 # One-hot encoding for categorical variables
+profiler.mark("encode")
 categorical_vars = cov_list[3:6]
 data_eur_encoded = pd.get_dummies(data_eur_cleaned, columns=categorical_vars, drop_first=True)
 print(f"Shape after one-hot encoding: {data_eur_encoded.shape}")
 
 # Split data with matched outcome distribution
+profiler.mark("split")
 def split_data_with_matched_distribution(data, outcome_var, test_size=0.2, bins=10):
     data['outcome_bin'] = pd.qcut(data[outcome_var], q=bins, duplicates='drop')
     X = data.drop(columns=[outcome_var, 'outcome_bin'])
@@ -101,7 +108,11 @@ print(f"Shape of X_train: {X_train.shape}")
 print(f"Shape of X_test: {X_test.shape}")
 
 # Function to plot and save histograms
+profiler.mark("plotting")
 def plot_outcome_histograms(y_train, y_test, outcome_var, plot_dir):
+    # Imported here: the rest of the script does not need matplotlib
+    import matplotlib.pyplot as plt
+
     plt.figure(figsize=(12, 6))
     plt.subplot(1, 2, 1)
     plt.hist(y_train, bins=30, edgecolor="black", alpha=0.7)
@@ -131,6 +142,7 @@ plot_dir = "4_prediction/plot"
 plot_outcome_histograms(y_train, y_test, outcome_var, plot_dir)
 
 # Z-normalization
+profiler.mark("scale")
 def z_normalize_with_outcome(X_train, X_test, y_train, y_test):
     feature_scaler = StandardScaler()
     X_train_scaled = feature_scaler.fit_transform(X_train)
@@ -142,11 +154,11 @@ def z_normalize_with_outcome(X_train, X_test, y_train, y_test):
     X_test_scaled = pd.DataFrame(X_test_scaled, columns=X_test.columns, index=X_test.index)
     y_train_scaled = pd.Series(y_train_scaled, index=y_train.index, name=y_train.name)
     y_test_scaled = pd.Series(y_test_scaled, index=y_test.index, name=y_test.name)
-    return X_train_scaled, X_test_scaled, y_train_scaled, y_test_scaled
-
-X_train_scaled, X_test_scaled, y_train_scaled, y_test_scaled = z_normalize_with_outcome(X_train, X_test, y_train, y_test)
+    return X_train_scaled, X_test_scaled, y_train_scaled, y_test_scaled, feature_scaler, outcome_scaler
 
+X_train_scaled, X_test_scaled, y_train_scaled, y_test_scaled, feature_scaler, outcome_scaler = z_normalize_with_outcome(X_train, X_test, y_train, y_test)
 
+profiler.mark("save")
 pd.DataFrame(train_subjectkeys, columns=["subjectkey"]).to_csv(
     os.path.join(base_dir, "train_subjectkeys.csv"), index=False
 )
@@ -158,4 +170,10 @@ X_test_scaled.to_csv(os.path.join(base_dir, "X_test_scaled.csv"), index=False)
 y_train_scaled.to_csv(os.path.join(base_dir, "y_train_scaled.csv"), index=False)
 y_test_scaled.to_csv(os.path.join(base_dir, "y_test_scaled.csv"), index=False)
 
+# Save scaler parameters for scoring new cohorts
+save_scaler_params(
+    os.path.join(base_dir, "scaler_params.json"), outcome_var, categorical_vars,
+    X_train.columns, feature_scaler, outcome_scaler
+)
+
 print(f"Data saved to directory: {base_dir}")
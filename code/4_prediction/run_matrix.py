@@ -0,0 +1,237 @@
+import os
+import sys
+import csv
+import json
+import math
+import time
+import socket
+import argparse
+import itertools
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import execution_profile
+import prediction_utils as pu
+
+# ---------------------------------------------------------
+# Resumable scheduler for the outcome x model type x seed matrix
+#
+# A cell is done when final_model_{n}.json and metrics_{n}.csv exist and
+# parse. Remaining cells run as `python <script> N` on a pool of worker
+# slots. A lock file per cell (created with O_EXCL) lets several nodes on a
+# shared filesystem drain the same matrix without running a cell twice.
+# ---------------------------------------------------------
+
+heartbeat_seconds = 60
+
+
+def parse_seeds(spec):
+    # "1-100", "1,5,7" or "1-10,20-30"
+    seeds = []
+    for part in spec.split(","):
+        if "-" in part:
+            first, last = part.split("-")
+            seeds += range(int(first), int(last) + 1)
+        else:
+            seeds.append(int(part))
+    return sorted(set(seeds))
+
+
+# ---------------------------------------------------------
+# Function: validation of finished cells
+# ---------------------------------------------------------
+def valid_model(path):
+    try:
+        with open(path) as f:
+            return "learner" in json.load(f)
+    except (OSError, ValueError):
+        return False
+
+
+def valid_metrics(path):
+    try:
+        with open(path, newline="") as f:
+            rows = list(csv.reader(f))
+        names, values = rows[0], [float(v) for v in rows[1]]
+    except (OSError, ValueError, IndexError):
+        return False
+    # Optimal_Threshold is inf when no ROC point has Youden J > 0 (roc_curve's first threshold)
+    checked = [v for name, v in zip(names, values) if not name.endswith("_Optimal_Threshold")]
+    return any(name.startswith("Test_") for name in names) and all(math.isfinite(v) for v in checked)
+
+
+def cell_done(base_dir, outcome_var, model_type, seed):
+    save_dir = os.path.join(base_dir, outcome_var)
+    return (valid_model(pu.model_path(save_dir, model_type, seed))
+            and valid_metrics(pu.metrics_path(save_dir, model_type, seed)))
+
+
+# ---------------------------------------------------------
+# Function: file-based cell locks
+# ---------------------------------------------------------
+def lock_path(base_dir, outcome_var, model_type, seed):
+    return os.path.join(base_dir, ".locks", f"{outcome_var}__{model_type}__{seed}.lock")
+
+
+def acquire_lock(path, stale_after):
+    # Returns the lock content written (the owner token), or None if the cell is locked
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        try:
+            age = time.time() - os.path.getmtime(path)
+            token = read_lock(path)
+        except FileNotFoundError:
+            return acquire_lock(path, stale_after)
+        if age < stale_after:
+            return None
+        # Claim the stale lock atomically; only one node wins the rename
+        stale_path = f"{path}.stale.{socket.gethostname()}.{os.getpid()}"
+        try:
+            os.rename(path, stale_path)
+        except FileNotFoundError:
+            return None
+        # Another node may have reclaimed it and written a fresh lock between our
+        # check and the rename: then we moved a live lock and must put it back
+        if read_lock(stale_path) != token or time.time() - os.path.getmtime(stale_path) < stale_after:
+            try:
+                os.link(stale_path, path)  # fails instead of overwriting a newer lock
+            except FileExistsError:
+                pass
+            os.remove(stale_path)
+            return None
+        os.remove(stale_path)
+        return acquire_lock(path, stale_after)
+
+    token = json.dumps({"host": socket.gethostname(), "pid": os.getpid(), "time": time.time()})
+    with os.fdopen(fd, "w") as f:
+        f.write(token)
+    return token
+
+
+def read_lock(path):
+    # Lock content (host, pid, time) identifies the lock owner
+    with open(path) as f:
+        return f.read()
+
+
+def release_lock(path, token):
+    # Only remove our own lock: after a stale reclaim the path may hold another node's lock
+    released_path = f"{path}.released.{socket.gethostname()}.{os.getpid()}"
+    try:
+        os.rename(path, released_path)
+    except FileNotFoundError:
+        return
+    if read_lock(released_path) != token:
+        try:
+            os.link(released_path, path)  # put the other node's lock back
+        except FileExistsError:
+            pass
+    os.remove(released_path)
+
+
+def append_status(log_path, row):
+    new_file = not os.path.exists(log_path)
+    with open(log_path, "a", newline="") as f:
+        writer = csv.writer(f)
+        if new_file:
+            writer.writerow(["outcome", "model_type", "seed", "status", "host", "seconds", "returncode"])
+        writer.writerow(row)
+
+
+# ---------------------------------------------------------
+# Function: run one cell
+# ---------------------------------------------------------
+def run_cell(cell, args):
+    outcome_var, model_type, seed = cell
+    path = lock_path(args.base_dir, outcome_var, model_type, seed)
+    token = acquire_lock(path, args.stale_after)
+    if token is None:
+        return "locked"
+
+    try:
+        # Another node may have finished it since the matrix was expanded
+        if cell_done(args.base_dir, outcome_var, model_type, seed):
+            return "done"
+
+        script = pu.find_training_script(args.base_dir, outcome_var, model_type)
+        log_dir = os.path.join(args.base_dir, outcome_var, "logs")
+        os.makedirs(log_dir, exist_ok=True)
+
+        # Core budget of the cell, read by execution_profile.py
+        env = dict(os.environ)
+        env["ABCD_GPS_NUM_CPUS"] = str(args.threads_per_job)
+        env["OMP_NUM_THREADS"] = str(args.threads_per_job)
+
+        start = time.time()
+        with open(os.path.join(log_dir, f"{model_type}_{seed}.log"), "w") as log:
+            proc = subprocess.Popen([sys.executable, script, str(seed)], stdout=log, stderr=subprocess.STDOUT, env=env)
+            while True:
+                try:
+                    proc.wait(timeout=heartbeat_seconds)
+                    break
+                except subprocess.TimeoutExpired:
+                    os.utime(path)  # keep the lock fresh for long cells
+        seconds = time.time() - start
+
+        ok = proc.returncode == 0 and cell_done(args.base_dir, outcome_var, model_type, seed)
+        status = "finished" if ok else "failed"
+        append_status(os.path.join(args.base_dir, "run_matrix_log.csv"),
+                      [outcome_var, model_type, seed, status, socket.gethostname(), f"{seconds:.1f}", proc.returncode])
+        print(f"{outcome_var} / {model_type} / seed {seed}: {status} in {seconds:.1f} s")
+        return status
+    finally:
+        release_lock(path, token)
+
+
+def expand_matrix(base_dir, outcomes, model_types, seeds):
+    cells = []
+    for outcome_var, model_type in itertools.product(outcomes, model_types):
+        if pu.find_training_script(base_dir, outcome_var, model_type) is None:
+            print(f"No training script for {outcome_var} / {model_type} - skipped")
+            continue
+        cells += [(outcome_var, model_type, seed) for seed in seeds]
+    return cells
+
+
+def find_outcomes(base_dir):
+    return sorted(
+        entry.name for entry in os.scandir(base_dir)
+        if entry.is_dir() and any(pu.find_training_script(base_dir, entry.name, m) for m in pu.model_types)
+    )
+
+
+# ---------------------------------------------------------
+# Main
+# ---------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the outcome x model type x seed matrix, skipping finished cells")
+    parser.add_argument("--base-dir", default="4_prediction/")
+    parser.add_argument("--outcomes", nargs="*", help="default: every outcome folder with training scripts")
+    parser.add_argument("--model-types", nargs="+", choices=pu.model_types, default=pu.model_types)
+    parser.add_argument("--seeds", default="1-100")
+    parser.add_argument("--jobs", type=int, default=1, help="number of cells run concurrently on this node")
+    parser.add_argument("--threads-per-job", type=int, default=0,
+                        help="cores given to each cell (0: detected cores // --jobs)")
+    parser.add_argument("--stale-after", type=float, default=3600, help="seconds without heartbeat before a lock is reclaimed")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    # Concurrent cells share the node's cores instead of each using all of them
+    args.threads_per_job = args.threads_per_job or max(1, execution_profile.detect_cores() // args.jobs)
+
+    outcomes = args.outcomes or find_outcomes(args.base_dir)
+    cells = expand_matrix(args.base_dir, outcomes, args.model_types, parse_seeds(args.seeds))
+    pending = [cell for cell in cells if not cell_done(args.base_dir, *cell)]
+    print(f"{len(cells)} cells, {len(cells) - len(pending)} already done, {len(pending)} pending")
+
+    if args.dry_run:
+        for cell in pending:
+            print(*cell)
+        sys.exit(0)
+
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        statuses = list(pool.map(lambda cell: run_cell(cell, args), pending))
+
+    for status in ["finished", "failed", "locked", "done"]:
+        print(f"{status}: {statuses.count(status)}")
@@ -0,0 +1,151 @@
+import os
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+import prediction_utils as pu
+
+# ---------------------------------------------------------
+# Ensemble scoring of new cohorts with the saved seed models
+#
+# The input is a raw subject table (subjectkey, GPS and covariate columns as
+# in the merged preprocessing data). It is read in chunks, encoded and scaled
+# with scaler_params.json from preprocessing, and scored with every
+# final_model_{n}.json of the outcome via inplace prediction.
+# ---------------------------------------------------------
+
+
+def load_ensemble(save_dir, model_type, n_threads):
+    model_files = pu.list_seed_files(pu.output_dir(save_dir, model_type, "models"), "final_model", "json")
+    if not model_files:
+        raise FileNotFoundError(f"No final_model_*.json in {pu.output_dir(save_dir, model_type, 'models')}")
+
+    seeds = sorted(model_files)
+    boosters = []
+    for n in seeds:
+        booster = xgb.Booster(model_file=model_files[n])
+        booster.set_param({"nthread": n_threads})
+        boosters.append((booster, pu.load_target_index(save_dir, model_type, n)))
+    return seeds, boosters
+
+
+def seed_prediction(booster, target_index, X):
+    # Joint multi-output models (multi_outcome_training.py) predict every target; keep this outcome's column
+    y_pred = booster.inplace_predict(X)
+    return y_pred[:, target_index] if y_pred.ndim == 2 else y_pred
+
+
+def ensemble_threshold(save_dir, model_type, seeds):
+    # Mean of the per-seed Youden thresholds on the test set. A seed whose ROC
+    # has no point with J > 0 gets threshold inf, which would make the mean inf
+    thresholds, skipped = [], []
+    for n in seeds:
+        path = pu.metrics_path(save_dir, model_type, n)
+        if os.path.exists(path):
+            threshold = float(pd.read_csv(path)["Test_Optimal_Threshold"].iloc[0])
+            if np.isfinite(threshold):
+                thresholds.append(threshold)
+            else:
+                skipped.append(n)
+    if skipped:
+        print(f"Warning: Test_Optimal_Threshold is not finite for seeds {skipped} - left out of the class threshold")
+    if not thresholds:
+        raise ValueError("No metrics_{n}.csv with a finite Test_Optimal_Threshold for the loaded models")
+    return float(np.mean(thresholds))
+
+
+def required_inputs(scaler, columns):
+    # Raw input columns the model features are built from (a dummy needs its categorical variable)
+    required = []
+    for c in columns:
+        source = next((v for v in scaler["categorical_vars"] if c.startswith(f"{v}_")), c)
+        if source not in required:
+            required.append(source)
+    return required
+
+
+def prepare_features(chunk, scaler, columns):
+    missing = [c for c in required_inputs(scaler, columns) if c not in chunk.columns]
+    if missing:
+        raise ValueError(f"Input is missing columns used by the models: {missing}")
+    categorical_vars = [c for c in scaler["categorical_vars"] if c in chunk.columns]
+
+    # Integer-valued categories read as float (e.g. 2.0) must still map to "_2" dummies
+    for c in categorical_vars:
+        values = chunk[c].dropna()
+        if pd.api.types.is_float_dtype(values) and (values == values.round()).all():
+            chunk[c] = chunk[c].astype("Int64")
+
+    encoded = pd.get_dummies(chunk, columns=categorical_vars)
+    dummy_columns = [c for c in scaler["feature_columns"] if any(c.startswith(f"{v}_") for v in scaler["categorical_vars"])]
+    for c in dummy_columns:
+        if c not in encoded.columns:
+            encoded[c] = 0
+
+    X = encoded.reindex(columns=scaler["feature_columns"]).astype(float)
+    X = (X - np.array(scaler["feature_mean"])) / np.array(scaler["feature_scale"])
+    return X[columns].values.astype(np.float32)
+
+
+def score_cohort(base_dir, outcome_var, model_type, input_path, output_path, chunksize, n_threads):
+    classification = pu.is_classification(outcome_var)
+    save_dir = os.path.join(base_dir, outcome_var)
+
+    scaler = pu.load_scaler_params(os.path.join(save_dir, "scaler_params.json"))
+    columns = pu.selected_columns if model_type == "baseline" else scaler["feature_columns"]
+
+    seeds, boosters = load_ensemble(save_dir, model_type, n_threads)
+    threshold = ensemble_threshold(save_dir, model_type, seeds) if classification else None
+    print(f"Loaded {len(boosters)} {model_type} models for {outcome_var}")
+
+    n_scored = 0
+    start_time = time.perf_counter()
+    for chunk_idx, chunk in enumerate(pd.read_csv(input_path, chunksize=chunksize)):
+        X = prepare_features(chunk, scaler, columns)
+
+        predictions = np.empty((len(boosters), X.shape[0]), dtype=np.float32)
+        for i, (booster, target_index) in enumerate(boosters):
+            predictions[i] = seed_prediction(booster, target_index, X)
+
+        result = pd.DataFrame({"subjectkey": chunk["subjectkey"].values})
+        if classification:
+            result["Ensemble_Probability"] = predictions.mean(axis=0)
+            result["Ensemble_SD"] = predictions.std(axis=0)
+            result["Predicted_Class"] = (result["Ensemble_Probability"] >= threshold).astype(int)
+        else:
+            # Models were trained on the z-scored outcome
+            result["Ensemble_Prediction_Scaled"] = predictions.mean(axis=0)
+            result["Ensemble_SD_Scaled"] = predictions.std(axis=0)
+            result["Ensemble_Prediction"] = result["Ensemble_Prediction_Scaled"] * scaler["outcome_scale"] + scaler["outcome_mean"]
+
+        result.to_csv(output_path, mode="w" if chunk_idx == 0 else "a", header=chunk_idx == 0, index=False)
+
+        n_scored += X.shape[0]
+        elapsed = time.perf_counter() - start_time
+        print(f"Chunk {chunk_idx + 1}: {n_scored} subjects, {n_scored / elapsed:.1f} subjects/s")
+
+    elapsed = time.perf_counter() - start_time
+    print(f"Scored {n_scored} subjects with {len(boosters)} models in {elapsed:.2f} s "
+          f"({n_scored / max(elapsed, 1e-9):.1f} subjects/s)")
+    if classification:
+        print(f"Class threshold (mean Test_Optimal_Threshold): {threshold:.4f}")
+
+
+# ---------------------------------------------------------
+# Main
+# ---------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score a new cohort with the saved seed ensemble")
+    parser.add_argument("input", help="CSV with subjectkey, GPS and covariate columns")
+    parser.add_argument("output", help="CSV for the ensemble predictions")
+    parser.add_argument("--outcome", default="suicidal_behav_y_base")
+    parser.add_argument("--model-type", choices=pu.model_types, default="main")
+    parser.add_argument("--base-dir", default="4_prediction/")
+    parser.add_argument("--chunksize", type=int, default=50000)
+    parser.add_argument("--n-threads", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    score_cohort(args.base_dir, args.outcome, args.model_type, args.input, args.output,
+                 args.chunksize, args.n_threads)
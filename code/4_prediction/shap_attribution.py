@@ -0,0 +1,132 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+import prediction_utils as pu
+
+# ---------------------------------------------------------
+# TreeSHAP attribution across the saved seed ensemble
+#
+# Exact tree contributions (pred_contribs) are computed for X_test with every
+# final_model_{n}.json. X_test is split into DMatrix batches once and reused
+# for all models; only running sums are kept, so memory is bounded by
+# n_test x n_features plus one batch of contributions (or interactions).
+# ---------------------------------------------------------
+
+
+def make_batches(X, batch_size, n_threads):
+    return [
+        xgb.DMatrix(X[start:start + batch_size], nthread=n_threads)
+        for start in range(0, X.shape[0], batch_size)
+    ]
+
+
+def attribute_model_type(save_dir, model_type, X_test, batch_size, n_threads, interactions):
+    model_files = pu.list_seed_files(pu.output_dir(save_dir, model_type, "models"), "final_model", "json")
+    if not model_files:
+        return None
+
+    columns = pu.feature_columns(X_test, model_type)
+    X = X_test[columns].values.astype(np.float32)
+    batches = make_batches(X, batch_size, n_threads)
+    n_subjects, n_columns = X.shape[0], len(columns) + 1  # + bias term
+
+    # Running sums over seeds
+    subject_sum = np.zeros((n_subjects, n_columns))
+    seed_mean_abs = np.zeros((len(model_files), n_columns))
+    interaction_abs_sum = np.zeros((n_columns, n_columns)) if interactions else None
+
+    for seed_idx, n in enumerate(sorted(model_files)):
+        booster = xgb.Booster(model_file=model_files[n])
+        booster.set_param({"nthread": n_threads})
+        # Joint multi-output models return one contribution block per target; keep this outcome's
+        target = pu.load_target_index(save_dir, model_type, n)
+        target = slice(None) if target is None else target
+
+        start = 0
+        for dbatch in batches:
+            contribs = booster.predict(dbatch, pred_contribs=True)
+            contribs = contribs[:, target] if contribs.ndim == 3 else contribs
+            stop = start + contribs.shape[0]
+            subject_sum[start:stop] += contribs
+            seed_mean_abs[seed_idx] += np.abs(contribs).sum(axis=0)
+            if interactions:
+                interaction = booster.predict(dbatch, pred_interactions=True)
+                interaction = interaction[:, target] if interaction.ndim == 4 else interaction
+                interaction_abs_sum += np.abs(interaction).sum(axis=0)
+            start = stop
+
+        seed_mean_abs[seed_idx] /= n_subjects
+        print(f"{model_type}: model {n} done ({seed_idx + 1} / {len(model_files)})")
+
+    n_seeds = len(model_files)
+    feature_names = columns + ["BIAS"]
+    subject_mean = subject_sum / n_seeds
+
+    summary = pd.DataFrame({
+        "Model_Type": model_type,
+        "Feature": feature_names,
+        "Is_GPS": [name not in pu.selected_columns and name != "BIAS" for name in feature_names],
+        "N_Seeds": n_seeds,
+        "Mean_Abs_SHAP": seed_mean_abs.mean(axis=0),
+        "SD_Mean_Abs_SHAP": seed_mean_abs.std(axis=0, ddof=1) if n_seeds > 1 else np.nan,
+        "Mean_Abs_Ensemble_SHAP": np.abs(subject_mean).mean(axis=0),
+        "Mean_SHAP": subject_mean.mean(axis=0),
+    })
+    summary["Rank"] = summary["Mean_Abs_SHAP"].where(summary["Feature"] != "BIAS").rank(ascending=False)
+
+    subject_table = pd.DataFrame(subject_mean, columns=feature_names)
+    interaction_table = None
+    if interactions:
+        interaction_table = pd.DataFrame(interaction_abs_sum / (n_seeds * n_subjects),
+                                         index=feature_names, columns=feature_names)
+    return summary, subject_table, interaction_table
+
+
+def attribute_outcome(base_dir, outcome_var, batch_size, n_threads, interactions):
+    save_dir = os.path.join(base_dir, outcome_var)
+    attribution_dir = os.path.join(save_dir, "attribution")
+    os.makedirs(attribution_dir, exist_ok=True)
+
+    X_test = pd.read_csv(os.path.join(save_dir, "X_test_scaled.csv"))
+    test_subjectkeys = pd.read_csv(os.path.join(save_dir, "test_subjectkeys.csv"))["subjectkey"]
+
+    summaries = []
+    for model_type in pu.model_types:
+        result = attribute_model_type(save_dir, model_type, X_test, batch_size, n_threads, interactions)
+        if result is None:
+            continue
+        summary, subject_table, interaction_table = result
+        summaries.append(summary)
+
+        subject_table.insert(0, "subjectkey", test_subjectkeys.values)
+        subject_table.to_csv(os.path.join(attribution_dir, f"{model_type}_shap_subject_mean.csv"), index=False)
+        if interaction_table is not None:
+            interaction_table.to_csv(os.path.join(attribution_dir, f"{model_type}_shap_interaction_mean_abs.csv"))
+
+    if not summaries:
+        print(f"No saved models found for {outcome_var}")
+        return None
+
+    summary = pd.concat(summaries, ignore_index=True)
+    summary.to_csv(os.path.join(attribution_dir, "shap_summary.csv"), index=False)
+    return summary
+
+
+# ---------------------------------------------------------
+# Main
+# ---------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="TreeSHAP attribution for all saved seed models of an outcome")
+    parser.add_argument("--outcomes", nargs="+", default=["suicidal_behav_y_base"])
+    parser.add_argument("--base-dir", default="4_prediction/")
+    parser.add_argument("--batch-size", type=int, default=1024)
+    parser.add_argument("--n-threads", type=int, default=os.cpu_count())
+    parser.add_argument("--interactions", action="store_true", help="also accumulate mean |SHAP interaction| values")
+    args = parser.parse_args()
+
+    for outcome_var in args.outcomes:
+        attribute_outcome(args.base_dir, outcome_var, args.batch_size, args.n_threads, args.interactions)
+        print(f"Attribution for {outcome_var} completed successfully.")
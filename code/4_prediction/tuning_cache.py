@@ -0,0 +1,152 @@
+import os
+import json
+import time
+import hashlib
+import numpy as np
+from sklearn.base import is_classifier
+from sklearn.model_selection import GridSearchCV, cross_val_predict, check_cv
+
+# ---------------------------------------------------------
+# Persistent cache of model selection results
+#
+# The key hashes everything GridSearchCV + cross_val_predict depend on: the
+# training matrix, labels, feature subset, fold plan, param_grid, scoring and
+# the estimator parameters (including its random_state, but not its thread
+# count). A rerun with the same inputs reuses best_params_ and the CV
+# predictions. Entries are evicted least-recently-used first once the cache
+# exceeds max_bytes.
+# ---------------------------------------------------------
+
+default_max_bytes = 1024 ** 3
+
+# Estimator parameters that do not change the fitted model
+ignored_params = ["n_jobs", "nthread", "verbosity"]
+
+
+def _fold_plan(estimator, X, y, cv):
+    splitter = check_cv(cv, y, classifier=is_classifier(estimator))
+    return [test_idx.tolist() for _, test_idx in splitter.split(X, y)]
+
+
+def cache_key(estimator, param_grid, X, y, cv, scoring, method, feature_names):
+    h = hashlib.sha256()
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    y = np.ascontiguousarray(y, dtype=np.float64)
+    h.update(str(X.shape).encode())
+    h.update(X.tobytes())
+    h.update(y.tobytes())
+
+    spec = {
+        "feature_names": list(feature_names) if feature_names is not None else None,
+        "folds": _fold_plan(estimator, X, y, cv),
+        "param_grid": param_grid,
+        "scoring": scoring,
+        "method": method,
+        "estimator": type(estimator).__name__,
+        "estimator_params": {k: v for k, v in estimator.get_params().items() if k not in ignored_params},
+    }
+    h.update(json.dumps(spec, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+
+# ---------------------------------------------------------
+# Function: cache entries ({key}.npz with CV predictions, {key}.json with results)
+# ---------------------------------------------------------
+def _entry_paths(cache_dir, key):
+    return os.path.join(cache_dir, f"{key}.npz"), os.path.join(cache_dir, f"{key}.json")
+
+
+def load_entry(cache_dir, key):
+    npz_path, json_path = _entry_paths(cache_dir, key)
+    try:
+        with open(json_path) as f:
+            entry = json.load(f)
+        with np.load(npz_path) as data:
+            entry["y_cv_pred"] = data["y_cv_pred"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+    # Mark as recently used
+    now = time.time()
+    for path in (npz_path, json_path):
+        os.utime(path, (now, now))
+    return entry
+
+
+def save_entry(cache_dir, key, entry, y_cv_pred):
+    os.makedirs(cache_dir, exist_ok=True)
+    npz_path, json_path = _entry_paths(cache_dir, key)
+    suffix = f".{os.getpid()}.tmp"
+
+    # The .json is written last, so a readable .json implies a complete entry
+    np.savez(npz_path + suffix + ".npz", y_cv_pred=y_cv_pred)
+    os.replace(npz_path + suffix + ".npz", npz_path)
+    with open(json_path + suffix, "w") as f:
+        json.dump(entry, f, default=str)
+    os.replace(json_path + suffix, json_path)
+
+
+def evict(cache_dir, max_bytes):
+    entries = {}
+    for name in os.listdir(cache_dir):
+        key, ext = os.path.splitext(name)
+        if ext in (".npz", ".json"):
+            path = os.path.join(cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            size, last_used = entries.get(key, (0, 0))
+            entries[key] = (size + stat.st_size, max(last_used, stat.st_mtime))
+
+    total = sum(size for size, _ in entries.values())
+    for key, (size, _) in sorted(entries.items(), key=lambda item: item[1][1]):
+        if total <= max_bytes:
+            break
+        for path in _entry_paths(cache_dir, key):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        total -= size
+
+
+# ---------------------------------------------------------
+# Function: GridSearchCV + cross_val_predict with the cache
+# ---------------------------------------------------------
+def cached_model_selection(estimator, param_grid, X, y, scoring, cv=5, method="predict", feature_names=None,
+                           cache_dir="tuning_cache", max_bytes=default_max_bytes, n_jobs=1, profiler=None):
+    # cache_dir=None runs the plain grid search without reading or writing the cache
+    key = cache_key(estimator, param_grid, X, y, cv, scoring, method, feature_names) if cache_dir else None
+    entry = load_entry(cache_dir, key) if cache_dir else None
+    if entry is not None:
+        print(f"Tuning cache hit: {key[:12]}")
+        return entry["best_params"], entry["y_cv_pred"]
+
+    grid_search = GridSearchCV(
+        estimator=estimator,
+        param_grid=param_grid,
+        scoring=scoring,
+        cv=cv,
+        verbose=0,
+        n_jobs=n_jobs
+    )
+    grid_search.fit(X, y)
+
+    if profiler is not None:
+        profiler.mark("cv predict")
+    y_cv_pred = cross_val_predict(grid_search.best_estimator_, X, y, cv=cv, method=method, n_jobs=n_jobs)
+    if method == "predict_proba":
+        y_cv_pred = y_cv_pred[:, 1]
+
+    entry = {
+        "best_params": grid_search.best_params_,
+        "best_score": grid_search.best_score_,
+        "mean_test_score": grid_search.cv_results_["mean_test_score"].tolist(),
+        "std_test_score": grid_search.cv_results_["std_test_score"].tolist(),
+        "params": grid_search.cv_results_["params"],
+    }
+    if cache_dir:
+        save_entry(cache_dir, key, entry, y_cv_pred)
+        evict(cache_dir, max_bytes)
+    return grid_search.best_params_, y_cv_pred
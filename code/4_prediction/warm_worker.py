@@ -0,0 +1,358 @@
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import argparse
+import threading
+import traceback
+
+# ---------------------------------------------------------
+# Warm worker: one long-lived process runs many seed jobs
+#
+# `python xgboost_*_for_slurm.py N` pays the pandas / scikit-learn / XGBoost
+# import time and re-reads the same split CSVs for every seed. A worker
+# imports them once, keeps each outcome's split in memory (reloaded when the
+# CSVs change) and takes jobs (outcome, model type, seed) from a queue
+# directory:
+#   <queue>/pending/*.json  -> claimed by atomic rename into running/
+#   <queue>/done/*.json     <- result (metrics, seconds) or <queue>/failed/
+# Jobs run exactly like the training scripts (pu.fit_and_evaluate) and write
+# to the usual <outcome>/{model_type}_models, _metrics, _feature_importance.
+# A preprocessing job runs 4_prediction/preprocessing_<outcome>.py inside
+# the worker, so it also skips the imports.
+# Several workers (or nodes on a shared filesystem) can drain one queue.
+# A worker touches its claim in running/ every heartbeat_seconds; claims
+# older than --stale-after (their worker died) are taken back by another
+# worker, as run_matrix.py reclaims stale cell locks, and requeued into
+# pending/ (into failed/ after max_attempts).
+#
+#   python 4_prediction/warm_worker.py serve &
+#   python 4_prediction/warm_worker.py submit --outcome suicidal_behav_y_base --preprocess --seeds 1-100 --wait
+#
+# The client only needs the standard library, so submitting is instant.
+# ---------------------------------------------------------
+
+default_queue = "4_prediction/worker_queue"
+queue_states = ["pending", "running", "done", "failed"]
+heartbeat_seconds = 60
+max_attempts = 3
+
+
+def queue_dirs(queue_dir):
+    dirs = {state: os.path.join(queue_dir, state) for state in queue_states}
+    for path in dirs.values():
+        os.makedirs(path, exist_ok=True)
+    return dirs
+
+
+def plain_value(value):
+    # numpy scalars (e.g. the float32 Optimal_Threshold) and arrays as Python types
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return str(value)
+
+
+def write_json(path, content):
+    # Write then rename, so readers never see a partial file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(content, f, indent=2, default=plain_value)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def parse_seeds(spec):
+    # Same syntax as run_matrix.py: "1-100", "1,5,7" or "1-10,20-30"
+    seeds = []
+    for part in spec.split(","):
+        if "-" in part:
+            first, last = part.split("-")
+            seeds += range(int(first), int(last) + 1)
+        else:
+            seeds.append(int(part))
+    return sorted(set(seeds))
+
+
+# ---------------------------------------------------------
+# Function: client
+# ---------------------------------------------------------
+def submit_preprocessing(queue_dir, outcome_var):
+    dirs = queue_dirs(queue_dir)
+    job_id = f"{outcome_var}__preprocess__{uuid.uuid4().hex[:8]}"
+    job = {"id": job_id, "kind": "preprocess", "outcome": outcome_var, "submitted": time.time()}
+    write_json(os.path.join(dirs["pending"], f"{job_id}.json"), job)
+    print(f"Submitted preprocessing of {outcome_var} to {dirs['pending']}")
+    return [job_id]
+
+
+def submit(queue_dir, outcome_var, model_types, seeds):
+    dirs = queue_dirs(queue_dir)
+    batch = uuid.uuid4().hex[:8]
+    job_ids = []
+    for model_type in model_types:
+        for seed in seeds:
+            job_id = f"{outcome_var}__{model_type}__{seed}__{batch}"
+            job = {"id": job_id, "outcome": outcome_var, "model_type": model_type, "seed": seed,
+                   "submitted": time.time()}
+            write_json(os.path.join(dirs["pending"], f"{job_id}.json"), job)
+            job_ids.append(job_id)
+    print(f"Submitted {len(job_ids)} jobs to {dirs['pending']}")
+    return job_ids
+
+
+def wait(queue_dir, job_ids, poll_seconds=2.0, timeout=0):
+    # Returns the jobs that failed or were not finished within timeout seconds (0: no limit)
+    dirs = queue_dirs(queue_dir)
+    remaining, failed = set(job_ids), []
+    deadline = time.time() + timeout if timeout else None
+    while remaining:
+        for job_id in list(remaining):
+            for state in ("done", "failed"):
+                path = os.path.join(dirs[state], f"{job_id}.json")
+                if os.path.exists(path):
+                    with open(path) as f:
+                        result = json.load(f)
+                    remaining.discard(job_id)
+                    if state == "failed":
+                        failed.append(job_id)
+                        print(f"{job_id} failed: {result.get('error')}")
+                    else:
+                        print(f"{job_id} done in {result['seconds']:.1f} s")
+        if remaining and deadline is not None and time.time() > deadline:
+            print(f"Timed out after {timeout:.0f} s: {len(remaining)} jobs not finished")
+            return failed + sorted(remaining)
+        if remaining:
+            time.sleep(poll_seconds)
+    return failed
+
+
+# ---------------------------------------------------------
+# Function: worker
+# ---------------------------------------------------------
+def claim_next(dirs, worker_id):
+    # The first worker to rename a pending file owns the job
+    for file_name in sorted(os.listdir(dirs["pending"])):
+        if not file_name.endswith(".json"):
+            continue
+        claimed = os.path.join(dirs["running"], f"{file_name[:-5]}.{worker_id}.json")
+        try:
+            os.rename(os.path.join(dirs["pending"], file_name), claimed)
+        except FileNotFoundError:
+            continue
+        with open(claimed) as f:
+            return claimed, json.load(f)
+    return None, None
+
+
+def keep_fresh(path, stop):
+    # Heartbeat: touch the claim until the job ends, so other workers can tell it is alive
+    while not stop.wait(heartbeat_seconds):
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass  # briefly moved by a worker checking for stale claims
+
+
+def requeue_stale(dirs, worker_id, stale_after):
+    # Claims not touched for stale_after seconds belong to a dead worker
+    for file_name in os.listdir(dirs["running"]):
+        if not file_name.endswith(".json"):
+            continue
+        path = os.path.join(dirs["running"], file_name)
+        taken = f"{path}.requeue.{worker_id}"
+        try:
+            if time.time() - os.path.getmtime(path) < stale_after:
+                continue
+            # Take the stale claim atomically; only one worker wins the rename
+            os.rename(path, taken)
+        except FileNotFoundError:
+            continue
+        # Its worker may have touched it between our check and the rename: put it back
+        if time.time() - os.path.getmtime(taken) < stale_after:
+            try:
+                os.link(taken, path)  # fails instead of overwriting a newer claim
+            except FileExistsError:
+                pass
+            os.remove(taken)
+            continue
+
+        with open(taken) as f:
+            job = json.load(f)
+        job["attempts"] = job.get("attempts", 0) + 1
+        if job["attempts"] >= max_attempts:
+            state = "failed"
+            job["error"] = f"worker lost {job['attempts']} times (no heartbeat for {stale_after:.0f} s)"
+        else:
+            state = "pending"
+        write_json(os.path.join(dirs[state], f"{job['id']}.json"), job)
+        os.remove(taken)
+        print(f"{job['id']}: stale claim {file_name} moved to {state}/")
+
+
+class Worker:
+    def __init__(self, base_dir, queue_dir):
+        sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+        import execution_profile
+
+        # Pin BLAS threads before numpy is imported, as the training scripts do
+        self.profile = execution_profile.configure(prefer_gpu=False)
+        self.execution_profile = execution_profile
+
+        import prediction_utils as pu
+        from sklearn.model_selection import ParameterGrid
+
+        self.pu = pu
+        self.n_fits = len(ParameterGrid(pu.param_grid)) * 5
+        self.base_dir = base_dir
+        self.dirs = queue_dirs(queue_dir)
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}"
+        self.datasets = {}
+
+    def dataset(self, outcome_var):
+        # Cached split of an outcome, reloaded when preprocessing rewrote it
+        save_dir = os.path.join(self.base_dir, outcome_var)
+        files = [os.path.join(save_dir, f"{name}_scaled.csv") for name in ("X_train", "X_test", "y_train", "y_test")]
+        stamp = tuple(os.path.getmtime(path) for path in files)
+        cached = self.datasets.get(outcome_var)
+        if cached is None or cached[0] != stamp:
+            classification = self.pu.is_classification(outcome_var)
+            self.datasets[outcome_var] = (stamp, self.pu.load_scaled_data(save_dir, classification))
+        return self.datasets[outcome_var][1]
+
+    def run_preprocessing(self, job):
+        # preprocessing_<outcome>.py runs in this process with the modules already imported
+        import runpy
+
+        outcome_var = job["outcome"]
+        script = os.path.join(self.base_dir, f"preprocessing_{outcome_var}.py")
+        if not os.path.exists(script):
+            raise FileNotFoundError(f"{script} not found")
+        saved_argv = sys.argv
+        sys.argv = [script]
+        try:
+            namespace = runpy.run_path(script, run_name="__main__")
+        finally:
+            sys.argv = saved_argv
+        if "profiler" in namespace:
+            namespace["profiler"].finish()  # write the trace now, not at worker exit
+        self.datasets.pop(outcome_var, None)
+        return {"script": script}
+
+    def run_job(self, job):
+        if job.get("kind") == "preprocess":
+            return self.run_preprocessing(job)
+        pu = self.pu
+        outcome_var, model_type, seed = job["outcome"], job["model_type"], int(job["seed"])
+        if model_type not in pu.model_types:
+            raise ValueError(f"unknown model type {model_type!r}")
+        save_dir = os.path.join(self.base_dir, outcome_var)
+        classification = pu.is_classification(outcome_var)
+        X_train, X_test, y_train, y_test = self.dataset(outcome_var)
+        columns = pu.feature_columns(X_train, model_type)
+
+        # Classification runs on CPU; regression may use a visible GPU, as in the training scripts
+        device = self.execution_profile.detect_device(prefer_gpu=not classification)
+        search_jobs, search_threads = self.execution_profile.parallel_layout(
+            dict(self.profile, device=device), n_fits=self.n_fits, verbose=False)
+        final_model, best_params, metrics = pu.fit_and_evaluate(
+            X_train[columns].values, y_train.values, X_test[columns].values, y_test.values, classification, seed,
+            search_jobs=search_jobs, n_threads=search_threads, device=device, feature_names=columns,
+            cache_dir=os.path.join(save_dir, "tuning_cache"), final_threads=self.profile["n_cores"]
+        )
+        pu.save_seed_outputs(save_dir, model_type, seed, final_model, best_params, metrics, columns)
+        return {"best_params": best_params, "metrics": metrics,
+                "model_path": pu.model_path(save_dir, model_type, seed),
+                "metrics_path": pu.metrics_path(save_dir, model_type, seed)}
+
+    def serve(self, idle_timeout=0, poll_seconds=1.0, max_jobs=0, stale_after=600):
+        print(f"Worker {self.worker_id} waiting for jobs in {self.dirs['pending']}")
+        n_jobs, idle_since, last_check = 0, time.time(), 0.0
+        while not max_jobs or n_jobs < max_jobs:
+            if time.time() - last_check > heartbeat_seconds:
+                requeue_stale(self.dirs, self.worker_id, stale_after)
+                last_check = time.time()
+            claimed, job = claim_next(self.dirs, self.worker_id)
+            if job is None:
+                if idle_timeout and time.time() - idle_since > idle_timeout:
+                    print(f"Idle for {idle_timeout} s - stopping")
+                    break
+                time.sleep(poll_seconds)
+                continue
+
+            start = time.perf_counter()
+            result = {**job, "worker": self.worker_id}
+            stop = threading.Event()
+            heartbeat = threading.Thread(target=keep_fresh, args=(claimed, stop), daemon=True)
+            heartbeat.start()
+            try:
+                result.update(self.run_job(job))
+                state = "done"
+            except Exception as error:
+                result.update(error=repr(error), traceback=traceback.format_exc())
+                state = "failed"
+            finally:
+                stop.set()
+                heartbeat.join()
+            result["seconds"] = time.perf_counter() - start
+            try:
+                write_json(os.path.join(self.dirs[state], f"{job['id']}.json"), result)
+            except Exception as error:
+                # The result could not be saved: record the job as failed and keep serving
+                state = "failed"
+                failure = {**job, "worker": self.worker_id, "seconds": result["seconds"],
+                           "error": f"result not saved: {error!r}", "traceback": traceback.format_exc()}
+                try:
+                    write_json(os.path.join(self.dirs[state], f"{job['id']}.json"), failure)
+                except Exception as write_error:
+                    print(f"{job['id']}: could not record the failure ({write_error!r}), left in running/")
+                    continue
+            try:
+                os.remove(claimed)
+            except FileNotFoundError:
+                print(f"{job['id']}: claim was requeued as stale while running")
+            print(f"{job['id']}: {state} in {result['seconds']:.1f} s")
+            n_jobs += 1
+            idle_since = time.time()
+
+
+# ---------------------------------------------------------
+# Main
+# ---------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Long-lived training worker and its client")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="run jobs from the queue directory")
+    serve_parser.add_argument("--base-dir", default="4_prediction/")
+    serve_parser.add_argument("--queue-dir", default=default_queue)
+    serve_parser.add_argument("--idle-timeout", type=float, default=0, help="stop after this many idle seconds (0: never)")
+    serve_parser.add_argument("--max-jobs", type=int, default=0, help="stop after this many jobs (0: no limit)")
+    serve_parser.add_argument("--stale-after", type=float, default=600,
+                              help="seconds without heartbeat before a running claim is requeued")
+
+    submit_parser = subparsers.add_parser("submit", help="queue (outcome, model type, seed) jobs")
+    submit_parser.add_argument("--queue-dir", default=default_queue)
+    submit_parser.add_argument("--outcome", required=True)
+    submit_parser.add_argument("--model-types", nargs="+", default=["baseline", "main"], choices=["baseline", "main"])
+    submit_parser.add_argument("--seeds", default="1", help="e.g. 1-100 or 1,5,7")
+    submit_parser.add_argument("--preprocess", action="store_true",
+                               help="run preprocessing_<outcome>.py first and wait for it before queueing the seeds")
+    submit_parser.add_argument("--wait", action="store_true", help="block until every job is done or failed")
+    submit_parser.add_argument("--timeout", type=float, default=0, help="stop waiting after this many seconds (0: no limit)")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        Worker(args.base_dir, args.queue_dir).serve(args.idle_timeout, max_jobs=args.max_jobs,
+                                                    stale_after=args.stale_after)
+    else:
+        if args.preprocess and wait(args.queue_dir, submit_preprocessing(args.queue_dir, args.outcome),
+                                    timeout=args.timeout):
+            sys.exit(1)
+        job_ids = submit(args.queue_dir, args.outcome, args.model_types, parse_seeds(args.seeds))
+        if args.wait and wait(args.queue_dir, job_ids, timeout=args.timeout):
+            sys.exit(1)
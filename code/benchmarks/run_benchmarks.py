@@ -0,0 +1,269 @@
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import socket
+import fnmatch
+import argparse
+import platform
+import subprocess
+import statistics
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# ---------------------------------------------------------
+# Timed, repeatable benchmarks of the pipeline on synthetic data
+#
+#   python benchmarks/run_benchmarks.py run --n-subjects 11000 --label v1.2
+#   python benchmarks/run_benchmarks.py compare results/a.json results/b.json
+#
+# Every benchmark runs the real script as a subprocess in a working directory
+# filled by synthetic_data.py, so import and I/O costs are included. Each
+# result file records the scale, environment, git commit, the per-repeat
+# wall/CPU times and the stage profile of the last repeat (stage_profiler.py).
+# ---------------------------------------------------------
+
+code_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+results_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# The classification preprocessing script writes to this absolute path
+capsule_dir = "/root/capsule/results/4_prediction"
+
+prediction_dir = os.path.join(code_dir, "4_prediction")
+training_scripts = {
+    "train_classification_baseline": os.path.join(prediction_dir, "suicidal_behav_y_base",
+                                                  "xgboost_classification_baseline_for_slurm.py"),
+    "train_classification_main": os.path.join(prediction_dir, "suicidal_behav_y_base",
+                                              "xgboost_classification_main_for_slurm.py"),
+    "train_regression_baseline": os.path.join(prediction_dir, "nihtbx_cryst_uncorrected_base",
+                                              "xgboost_regression_baseline_for_slurm.py"),
+    "train_regression_main": os.path.join(prediction_dir, "nihtbx_cryst_uncorrected_base",
+                                          "xgboost_regression_mainmodel_for_slurm.py"),
+}
+
+sigtest_block2_call = (
+    "import sys; sys.path.insert(0, {path!r}); import sigtest_block2 as s; "
+    "s.two_block_CCA_summary('2block_results', ['']); s.two_block_CCA_pval('2block_results', [''])"
+)
+
+
+def benchmark_commands():
+    # name -> (command, outcome whose tuning cache must be cleared before each repeat)
+    commands = {
+        "correlation_r": (["Rscript", os.path.join(code_dir, "2_correlation", "code_corr_brianIDPs_w33gps_public.R")], None),
+        "sigtest_block2": ([sys.executable, "-c", sigtest_block2_call.format(path=os.path.join(code_dir, "3_cca", "2block"))], None),
+        "sigtest_block3": ([sys.executable, os.path.join(code_dir, "3_cca", "3block", "sigtest_block3.py")], None),
+        "preprocess_classification": ([sys.executable, os.path.join(prediction_dir, "preprocessing_suicidal_behav_y_base.py")], None),
+        "preprocess_regression": ([sys.executable, os.path.join(prediction_dir, "preprocessing_nihtbx_cryst_uncorrected_base.py")], None),
+    }
+    for name, script in training_scripts.items():
+        outcome = os.path.basename(os.path.dirname(script))
+        commands[name] = ([sys.executable, script, "1"], outcome)
+    return commands
+
+
+# ---------------------------------------------------------
+# Function: environment and working directory
+# ---------------------------------------------------------
+def environment():
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=code_dir, text=True,
+                                         stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    packages = {}
+    try:
+        from importlib import metadata
+        for name in ["numpy", "pandas", "scikit-learn", "xgboost", "scipy", "matplotlib", "statsmodels"]:
+            try:
+                packages[name] = metadata.version(name)
+            except metadata.PackageNotFoundError:
+                packages[name] = None
+    except ImportError:
+        pass
+    return {"git_commit": commit, "host": socket.gethostname(), "cpu_count": os.cpu_count(),
+            "python": platform.python_version(), "platform": platform.platform(), "packages": packages}
+
+
+def prepare_workdir(work_dir):
+    # Training scripts read 4_prediction/<outcome>/*_scaled.csv relative to the working directory
+    os.makedirs(os.path.join(work_dir, "4_prediction", "plot"), exist_ok=True)
+    os.makedirs(os.path.join(work_dir, "2block_results", "perm_summary"), exist_ok=True)
+
+
+def ensure_split(work_dir, name, commands, env):
+    # Training benchmarks need the preprocessed split of their outcome
+    outcome = commands[name][1]
+    split_dir = os.path.join(work_dir, "4_prediction", outcome)
+    if os.path.exists(os.path.join(split_dir, "X_train_scaled.csv")):
+        return
+    prep = "preprocess_classification" if "classification" in name else "preprocess_regression"
+    subprocess.run(commands[prep][0], cwd=work_dir, env=env, check=True, stdout=subprocess.DEVNULL)
+    if not os.path.exists(os.path.join(split_dir, "X_train_scaled.csv")):
+        shutil.copytree(os.path.join(capsule_dir, outcome), split_dir, dirs_exist_ok=True)
+
+
+# ---------------------------------------------------------
+# Function: run one benchmark
+# ---------------------------------------------------------
+def children_usage():
+    if resource is None:
+        return 0.0, 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime, usage.ru_maxrss / 1024
+
+
+def latest_trace(trace_dir, since):
+    traces = [p for p in glob.glob(os.path.join(trace_dir, "*.json")) if os.path.getmtime(p) >= since]
+    if not traces:
+        return None
+    with open(max(traces, key=os.path.getmtime)) as f:
+        return json.load(f)
+
+
+def run_benchmark(name, command, outcome, work_dir, repeat, env):
+    trace_dir = os.path.join(work_dir, "profiles", name)
+    env = dict(env, ABCD_GPS_TRACE_DIR=trace_dir)
+    walls, cpus = [], []
+    for r in range(repeat):
+        if outcome:
+            shutil.rmtree(os.path.join(work_dir, "4_prediction", outcome, "tuning_cache"), ignore_errors=True)
+        cpu_before, _ = children_usage()
+        start_time = time.time()
+        start = time.perf_counter()
+        proc = subprocess.run(command, cwd=work_dir, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                              text=True)
+        wall = time.perf_counter() - start
+        if proc.returncode != 0:
+            print(proc.stdout[-2000:])
+            return {"status": "failed", "returncode": proc.returncode}
+        cpu_after, _ = children_usage()
+        walls.append(wall)
+        cpus.append(cpu_after - cpu_before)
+        print(f"  {name} repeat {r + 1}/{repeat}: {wall:.2f} s")
+
+    trace = latest_trace(trace_dir, start_time)
+    return {
+        "status": "ok",
+        "wall_s": [round(w, 4) for w in walls],
+        "cpu_s": [round(c, 4) for c in cpus],
+        "median_s": round(statistics.median(walls), 4),
+        "min_s": round(min(walls), 4),
+        "stdev_s": round(statistics.stdev(walls), 4) if len(walls) > 1 else 0.0,
+        "peak_rss_children_mb": round(children_usage()[1], 1),
+        "stages": trace["stages"] if trace else None,
+    }
+
+
+def run(args):
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import synthetic_data
+
+    work_dir = os.path.abspath(args.work_dir)
+    spec_path = os.path.join(work_dir, "synthetic_spec.json")
+    scale = {"n_subjects": args.n_subjects, "column_scale": args.column_scale, "n_pheno": args.n_pheno,
+             "seed": args.seed}
+    spec = None
+    if os.path.exists(spec_path):
+        with open(spec_path) as f:
+            spec = json.load(f)
+    if spec is None or any(spec.get(k) != v for k, v in scale.items()):
+        print(f"Generating synthetic data in {work_dir}")
+        shutil.rmtree(os.path.join(work_dir, "4_prediction"), ignore_errors=True)
+        spec = synthetic_data.generate(work_dir, **scale)
+    prepare_workdir(work_dir)
+
+    env = dict(os.environ)
+    if args.threads:
+        env["ABCD_GPS_NUM_CPUS"] = str(args.threads)
+
+    commands = benchmark_commands()
+    selected = [n for n in commands if any(fnmatch.fnmatch(n, pattern) for pattern in args.only)]
+    results = {}
+    for name in selected:
+        command, outcome = commands[name]
+        if shutil.which(command[0]) is None:
+            print(f"{name}: {command[0]} not found - skipped")
+            results[name] = {"status": "skipped"}
+            continue
+        if name.startswith("train_"):
+            ensure_split(work_dir, name, commands, env)
+        print(f"{name}")
+        results[name] = run_benchmark(name, command, outcome, work_dir, args.repeat, env)
+
+    report = {"label": args.label, "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "repeat": args.repeat,
+              "threads": args.threads, "scale": spec, "environment": environment(), "benchmarks": results}
+    os.makedirs(args.results_dir, exist_ok=True)
+    path = os.path.join(args.results_dir, f"{args.label}_{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {path}")
+    return path
+
+
+# ---------------------------------------------------------
+# Function: compare two result files
+# ---------------------------------------------------------
+def compare(args):
+    with open(args.baseline) as f:
+        old = json.load(f)
+    with open(args.candidate) as f:
+        new = json.load(f)
+    if old.get("scale", {}).get("n_subjects") != new.get("scale", {}).get("n_subjects"):
+        print("Warning: the two runs use different synthetic scales")
+
+    regressions = 0
+    print(f"{'benchmark':<32} {old['label']:>12} {new['label']:>12} {'ratio':>8}")
+    for name in sorted(set(old["benchmarks"]) & set(new["benchmarks"])):
+        a, b = old["benchmarks"][name], new["benchmarks"][name]
+        if a.get("status") != "ok" or b.get("status") != "ok":
+            print(f"{name:<32} {a.get('status'):>12} {b.get('status'):>12}")
+            continue
+        ratio = b["median_s"] / a["median_s"]
+        flag = ""
+        if ratio > 1 + args.threshold:
+            flag = "REGRESSION"
+            regressions += 1
+        elif ratio < 1 - args.threshold:
+            flag = "faster"
+        print(f"{name:<32} {a['median_s']:>11.2f}s {b['median_s']:>11.2f}s {ratio:>8.2f} {flag}")
+    return regressions
+
+
+# ---------------------------------------------------------
+# Main
+# ---------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pipeline benchmarks on synthetic data")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="generate data (if needed) and time the benchmarks")
+    run_parser.add_argument("--label", default="current", help="name of this run, e.g. a version or branch")
+    run_parser.add_argument("--work-dir", default="benchmark_data")
+    run_parser.add_argument("--results-dir", default=results_dir)
+    run_parser.add_argument("--n-subjects", type=int, default=11000)
+    run_parser.add_argument("--column-scale", type=float, default=1.0)
+    run_parser.add_argument("--n-pheno", type=int, default=60)
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--repeat", type=int, default=3)
+    run_parser.add_argument("--threads", type=int, default=0, help="core budget of the scripts (0: all)")
+    run_parser.add_argument("--only", nargs="+", default=["*"], help="benchmark name patterns, e.g. 'train_*'")
+
+    compare_parser = subparsers.add_parser("compare", help="compare median times of two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="relative change flagged (0.1 = 10%%)")
+    compare_parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        run(args)
+    else:
+        regressions = compare(args)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
@@ -0,0 +1,207 @@
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+
+# ---------------------------------------------------------
+# Schema-compatible synthetic ABCD tables at configurable scale
+#
+# Writes the same files (and file names) the pipeline scripts read, so
+# they run unchanged in the output directory:
+#   gps_eur_synthetic_100.csv, demo_/xgb_/pheno_/smri_/... _synthetic_EUR_100.csv,
+#   subjectlist_EUR_100.csv, and SGCCA permutation outputs for sigtest_*.py.
+# File names keep the "_100" suffix the scripts expect, whatever the number
+# of subjects. GPS, brain and phenotype columns share a few latent factors so
+# correlations and models have signal.
+# ---------------------------------------------------------
+
+gps_variables = [
+    "GMeur", "WMeur", "TBVeur", "HEIGHTeur", "CPeur2", "EAeur1", "MDDeur6", "INSOMNIAeur6",
+    "SNORINGeur1", "IQeur2", "PTSDeur4", "ADHDeur6", "DEPeur4", "BMIeur4", "ALCDEP_EURauto",
+    "ASDauto", "ASPauto", "BIPauto", "CANNABISauto", "CROSSauto", "DRINKauto", "EDauto",
+    "NEUROTICISMauto", "OCDauto", "RISK4PCauto", "RISKTOLauto", "SCZ_EURauto", "SMOKERauto",
+    "WORRYauto", "SWBeur4", "GHappiHealth6", "GHappiMeaneur1", "GHappieur2"
+]
+
+discrete_y_vars = ['any_psych_dx_p_base', 'adhd_p_base', 'any_dep_dx_p_base',
+                   'any_anx_dx_p_base', 'suicidal_behav_p_base', 'any_psych_dx_p_2yr',
+                   'adhd_p_2yr', 'any_dep_dx_p_2yr', 'any_anx_dx_p_2yr',
+                   'suicidal_behav_p_2yr', 'any_psych_dx_y_base', 'any_dep_dx_y_base',
+                   'any_anx_dx_y_base', 'suicidal_behav_y_base', 'any_psych_dx_y_2yr',
+                   'any_dep_dx_y_2yr', 'any_anx_dx_y_2yr', 'suicidal_behav_y_2yr']
+
+cbcl_scales = ["anxdep", "withdep", "somatic", "social", "thought", "attention", "rulebreak", "aggressive",
+               "internal", "external", "totprob"]
+nihtbx_tests = ["picvocab", "flanker", "list", "cardsort", "pattern", "picture", "reading", "fluidcomp",
+                "cryst", "totalcomp"]
+
+# Default column counts per modality (smri matches the 390 sMRI features of block2.R)
+modality_columns = {"smri": 390, "count": 200, "fa": 200, "rsfmri": 300, "midfmri": 200, "nbackfmri": 200,
+                    "sstfmri": 200}
+
+# Range selectors used by block2.R/block3.R
+smri_first, smri_last = "lh_bankssts_area._.1", "wm.rh.insula._.18"
+pheno_first, pheno_last = "asr_scr_adhd_r", "famhx_ss_parent_vs_p"
+
+n_factors = 5
+
+
+def subject_keys(rng, n):
+    keys = set()
+    while len(keys) < n:
+        keys.update(f"NDAR_INV{k:08X}" for k in rng.integers(0, 16 ** 8, size=n - len(keys)))
+    return np.array(sorted(keys))
+
+
+def loaded_block(rng, factors, n_columns, signal=0.3):
+    # Columns = small loadings on the shared factors + unit noise
+    loadings = rng.normal(0, signal, size=(factors.shape[1], n_columns))
+    return factors @ loadings + rng.standard_normal((factors.shape[0], n_columns))
+
+
+def with_missing(rng, values, rate):
+    values = values.astype(float)
+    values[rng.random(values.shape) < rate] = np.nan
+    return values
+
+
+def levels(rng, n, n_levels):
+    # Every level occurs at least once, so one-hot columns match the real data
+    codes = rng.integers(1, n_levels + 1, size=n)
+    codes[:n_levels] = np.arange(1, n_levels + 1)
+    return rng.permutation(codes)
+
+
+# ---------------------------------------------------------
+# Function: tables
+# ---------------------------------------------------------
+def gps_table(rng, keys, factors):
+    n = len(keys)
+    gps = pd.DataFrame(loaded_block(rng, factors, len(gps_variables), signal=0.5), columns=gps_variables)
+    gps.insert(0, "subjectkey", keys)
+    gps.insert(1, "IID", keys)
+    gps.insert(2, "ethnic_g", np.where(rng.random(n) < 0.9, "EUR", "AFR"))
+    gps.insert(3, "set", np.where(rng.random(n) < 0.85, "test", "train"))
+    return gps
+
+
+def demo_table(rng, keys):
+    n = len(keys)
+    return pd.DataFrame({
+        "subjectkey": keys,
+        "age": rng.integers(107, 133, size=n),
+        "high.educ": rng.integers(1, 6, size=n),
+        "income": rng.integers(1, 11, size=n),
+        "race.ethnicity": levels(rng, n, 5),
+        "married": levels(rng, n, 6),
+        "abcd_site": levels(rng, n, 22),
+    })
+
+
+def target_table(rng, keys, factors):
+    n = len(keys)
+    columns = {"subjectkey": keys}
+    liability = loaded_block(rng, factors, len(discrete_y_vars))
+    for j, name in enumerate(discrete_y_vars):
+        prevalence = 0.05 if "suicidal" in name else 0.15
+        cases = (liability[:, j] > np.quantile(liability[:, j], 1 - prevalence)).astype(float)
+        columns[name] = with_missing(rng, cases, 0.05)
+
+    cbcl_names = [f"cbcl_scr_syn_{s}_r_{t}" for t in ("base", "2yr") for s in cbcl_scales]
+    cbcl = np.round(np.exp(loaded_block(rng, factors, len(cbcl_names)) / 2) * 3)
+    columns.update({name: with_missing(rng, cbcl[:, j], 0.05) for j, name in enumerate(cbcl_names)})
+
+    nihtbx_names = [f"nihtbx_{t}_uncorrected_{w}" for w in ("base", "2yr") for t in nihtbx_tests]
+    nihtbx = 100 + 10 * loaded_block(rng, factors, len(nihtbx_names))
+    columns.update({name: with_missing(rng, nihtbx[:, j], 0.05) for j, name in enumerate(nihtbx_names)})
+    return pd.DataFrame(columns)
+
+
+def modality_table(rng, keys, factors, modality, n_columns, missing_subjects=0.1):
+    if modality == "smri":
+        names = [smri_first] + [f"smri_feature_{j}" for j in range(2, n_columns)] + [smri_last]
+    else:
+        names = [f"{modality}_feature_{j}" for j in range(1, n_columns + 1)]
+    table = pd.DataFrame(with_missing(rng, loaded_block(rng, factors, n_columns), 0.01), columns=names[:n_columns])
+    table.insert(0, "subjectkey", keys)
+    # Whole-subject missingness, as for failed QC of a modality
+    return table[rng.random(len(keys)) >= missing_subjects].reset_index(drop=True)
+
+
+def pheno_table(rng, keys, factors, n_columns):
+    names = [pheno_first] + [f"pheno_feature_{j}" for j in range(2, n_columns)] + [pheno_last]
+    table = pd.DataFrame(loaded_block(rng, factors, n_columns), columns=names[:n_columns])
+    table.insert(0, "subjectkey", keys)
+    return table
+
+
+# ---------------------------------------------------------
+# Function: SGCCA permutation outputs (the input of sigtest_block2/3.py)
+# ---------------------------------------------------------
+# sigtest_block2/3.py read exactly the permutations 1-100
+n_permutations = 100
+
+
+def write_permutation_outputs(rng, result_dir, n_components=5):
+    os.makedirs(result_dir, exist_ok=True)
+    original = np.sort(rng.uniform(0.2, 0.6, size=n_components))[::-1]
+    for name in ("crit", "corr"):
+        np.savetxt(os.path.join(result_dir, f"original_{name}.csv"), original[None, :], delimiter=",")
+        for i in range(1, n_permutations + 1):
+            null = np.sort(rng.uniform(0.1, 0.5, size=n_components))[::-1]
+            np.savetxt(os.path.join(result_dir, f"{i}-th_permutation_{name}.csv"), null[:, None], delimiter=",")
+
+
+def generate(out_dir, n_subjects=11000, column_scale=1.0, n_pheno=60, seed=0):
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    keys = subject_keys(rng, n_subjects)
+    factors = rng.standard_normal((n_subjects, n_factors))
+
+    gps = gps_table(rng, keys, factors)
+    gps.to_csv(os.path.join(out_dir, "gps_eur_synthetic_100.csv"), index=False)
+    eur = gps.loc[gps["ethnic_g"] == "EUR", "subjectkey"]
+    pd.DataFrame({"x": eur}).to_csv(os.path.join(out_dir, "subjectlist_EUR_100.csv"), index=False)
+
+    demo_table(rng, keys).to_csv(os.path.join(out_dir, "demo_synthetic_EUR_100.csv"), index=False)
+    target_table(rng, keys, factors).to_csv(os.path.join(out_dir, "xgb_synthetic_EUR_100.csv"), index=False)
+    pheno_table(rng, keys, factors, n_pheno).to_csv(os.path.join(out_dir, "pheno_synthetic_EUR_100.csv"), index=False)
+
+    shapes = {}
+    for modality, n_columns in modality_columns.items():
+        n_columns = max(2, int(round(n_columns * column_scale)))
+        table = modality_table(rng, keys, factors, modality, n_columns)
+        table.to_csv(os.path.join(out_dir, f"{modality}_synthetic_EUR_100.csv"), index=False)
+        shapes[modality] = list(table.shape)
+
+    write_permutation_outputs(rng, os.path.join(out_dir, "2block_results"))
+    write_permutation_outputs(rng, os.path.join(out_dir, "3block", "output"))
+
+    # The correlation script reads data/<file> and writes output/<file>
+    os.makedirs(os.path.join(out_dir, "output"), exist_ok=True)
+    data_link = os.path.join(out_dir, "data")
+    if not os.path.lexists(data_link):
+        os.symlink(".", data_link)
+
+    spec = {"n_subjects": n_subjects, "column_scale": column_scale, "n_pheno": n_pheno,
+            "n_permutations": n_permutations, "seed": seed, "modality_shapes": shapes}
+    with open(os.path.join(out_dir, "synthetic_spec.json"), "w") as f:
+        json.dump(spec, f, indent=2)
+    return spec
+
+
+# ---------------------------------------------------------
+# Main
+# ---------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate schema-compatible synthetic ABCD tables")
+    parser.add_argument("out_dir")
+    parser.add_argument("--n-subjects", type=int, default=11000)
+    parser.add_argument("--column-scale", type=float, default=1.0, help="multiplier on the modality column counts")
+    parser.add_argument("--n-pheno", type=int, default=60, help="columns of the phenotype block")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    spec = generate(args.out_dir, args.n_subjects, args.column_scale, args.n_pheno, args.seed)
+    print(json.dumps(spec, indent=2))
@@ -0,0 +1,227 @@
+import os
+import sys
+import json
+import time
+import atexit
+import socket
+import argparse
+import contextlib
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# ---------------------------------------------------------
+# Stage-level profiling shared by the pipeline scripts
+#
+# Flat scripts call profiler.mark("load"), profiler.mark("merge"), ... and
+# each mark closes the previous stage; `with profiler.stage(name):` works
+# too. Per stage: wall time, CPU time of this process and of finished
+# child processes, peak RSS (high-water mark at the end of the stage) and
+# bytes read/written by this process. One JSON trace per run is written
+# to <trace_dir> at exit (default $ABCD_GPS_TRACE_DIR or ./profiles).
+#
+#   python stage_profiler.py aggregate 4_prediction/ --top 20
+# lists the slowest stages across every trace found under the given paths.
+# Only the standard library is needed (psutil is used for I/O if present).
+# ---------------------------------------------------------
+
+default_trace_dir = "profiles"
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return (psutil.Process().memory_info().rss if psutil else 0) / 1024 ** 2, 0.0
+    # ru_maxrss is in KB on Linux, bytes on macOS
+    scale = 1024 ** 2 if sys.platform == "darwin" else 1024
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale)
+
+
+def _io_bytes():
+    # Logical bytes read/written (includes page-cache hits, which is what CSV parsing costs)
+    try:
+        with open("/proc/self/io") as f:
+            counters = dict(line.split(": ") for line in f.read().splitlines())
+        return int(counters["rchar"]), int(counters["wchar"])
+    except (OSError, KeyError, ValueError):
+        pass
+    if psutil is not None:
+        try:
+            counters = psutil.Process().io_counters()
+            return counters.read_bytes, counters.write_bytes
+        except (AttributeError, psutil.Error):
+            pass
+    return 0, 0
+
+
+def _snapshot():
+    times = os.times()
+    read, written = _io_bytes()
+    return {"wall": time.perf_counter(), "cpu": times.user + times.system,
+            "cpu_children": times.children_user + times.children_system, "read": read, "write": written}
+
+
+def _delta(start, end):
+    peak, peak_children = _peak_rss_mb()
+    return {
+        "wall_s": round(end["wall"] - start["wall"], 4),
+        "cpu_s": round(end["cpu"] - start["cpu"], 4),
+        "cpu_children_s": round(end["cpu_children"] - start["cpu_children"], 4),
+        "peak_rss_mb": round(peak, 1),
+        "peak_rss_children_mb": round(peak_children, 1),
+        "read_mb": round((end["read"] - start["read"]) / 1024 ** 2, 3),
+        "write_mb": round((end["write"] - start["write"]) / 1024 ** 2, 3),
+    }
+
+
+# ---------------------------------------------------------
+# Class: per-run profiler
+# ---------------------------------------------------------
+class Profiler:
+    def __init__(self, name=None, trace_dir=None, verbose=True, **labels):
+        self.name = name or os.path.splitext(os.path.basename(sys.argv[0]))[0]
+        self.trace_dir = trace_dir or os.environ.get("ABCD_GPS_TRACE_DIR", default_trace_dir)
+        self.labels = {k: str(v) for k, v in labels.items()}  # e.g. outcome, seed
+        self.verbose = verbose
+        self.stages = []
+        self._start = _snapshot()
+        self._start_time = time.time()
+        self._current = None
+        self._finished = False
+        atexit.register(self.finish)
+
+    def mark(self, stage):
+        # Close the running stage and start the next one
+        self._close()
+        self._current = (stage, _snapshot())
+
+    @contextlib.contextmanager
+    def stage(self, stage):
+        self.mark(stage)
+        try:
+            yield
+        finally:
+            self._close()
+
+    def _close(self):
+        if self._current is not None:
+            stage, start = self._current
+            self.stages.append({"stage": stage, **_delta(start, _snapshot())})
+            self._current = None
+
+    def finish(self):
+        if self._finished:
+            return None
+        self._close()
+        self._finished = True
+
+        trace = {
+            "script": self.name,
+            "labels": self.labels,
+            "argv": sys.argv,
+            "host": socket.gethostname(),
+            "pid": os.getpid(),
+            "start_time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self._start_time)),
+            "total": _delta(self._start, _snapshot()),
+            "stages": self.stages,
+        }
+        os.makedirs(self.trace_dir, exist_ok=True)
+        suffix = "_".join(self.labels.values())
+        file_name = f"{self.name}{'_' + suffix if suffix else ''}_{time.strftime('%Y%m%d-%H%M%S')}_{os.getpid()}.json"
+        path = os.path.join(self.trace_dir, file_name)
+        with open(path, "w") as f:
+            json.dump(trace, f, indent=2)
+
+        if self.verbose:
+            print(f"Stage profile ({trace['total']['wall_s']:.1f} s wall, "
+                  f"{trace['total']['peak_rss_mb']:.0f} MB peak RSS) saved to {path}")
+            for row in self.stages:
+                print(f"  {row['stage']:<20} {row['wall_s']:>9.2f} s  cpu {row['cpu_s'] + row['cpu_children_s']:>9.2f} s"
+                      f"  read {row['read_mb']:>9.1f} MB  write {row['write_mb']:>9.1f} MB")
+        return path
+
+
+# ---------------------------------------------------------
+# Function: aggregate traces over an experiment matrix
+# ---------------------------------------------------------
+def find_traces(paths):
+    for path in paths:
+        if os.path.isfile(path):
+            yield path
+            continue
+        for root, _, files in os.walk(path):
+            for file_name in files:
+                if file_name.endswith(".json"):
+                    yield os.path.join(root, file_name)
+
+
+def load_traces(paths):
+    traces = []
+    for path in find_traces(paths):
+        try:
+            with open(path) as f:
+                trace = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if isinstance(trace, dict) and "stages" in trace and "script" in trace:
+            traces.append(trace)
+    return traces
+
+
+def aggregate(traces):
+    import pandas as pd
+
+    rows = [{"script": t["script"], **stage} for t in traces for stage in t["stages"]]
+    if not rows:
+        return pd.DataFrame()
+    stages = pd.DataFrame(rows)
+    stages["cpu_total_s"] = stages["cpu_s"] + stages["cpu_children_s"]
+
+    grouped = stages.groupby(["script", "stage"], sort=False)
+    summary = grouped.agg(
+        runs=("wall_s", "size"),
+        wall_total_s=("wall_s", "sum"),
+        wall_mean_s=("wall_s", "mean"),
+        wall_median_s=("wall_s", "median"),
+        wall_max_s=("wall_s", "max"),
+        cpu_mean_s=("cpu_total_s", "mean"),
+        peak_rss_max_mb=("peak_rss_mb", "max"),
+        read_mean_mb=("read_mb", "mean"),
+        write_mean_mb=("write_mb", "mean"),
+    )
+    # Share of the script's total run time spent in this stage
+    run_totals = pd.DataFrame([{"script": t["script"], "run_wall_s": t["total"]["wall_s"]} for t in traces])
+    summary["share_of_runtime"] = summary["wall_total_s"] / run_totals.groupby("script")["run_wall_s"].sum().reindex(
+        summary.index.get_level_values("script")).values
+    summary["cpu_utilization"] = summary["cpu_mean_s"] / summary["wall_mean_s"]
+    return summary.sort_values("wall_total_s", ascending=False).reset_index()
+
+
+# ---------------------------------------------------------
+# Main
+# ---------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stage profiles of the pipeline scripts")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    agg = subparsers.add_parser("aggregate", help="slowest stages across all traces under the given paths")
+    agg.add_argument("paths", nargs="+", help="trace files or directories searched recursively")
+    agg.add_argument("--top", type=int, default=20)
+    agg.add_argument("--out", help="save the full summary as CSV")
+    args = parser.parse_args()
+
+    traces = load_traces(args.paths)
+    summary = aggregate(traces)
+    print(f"{len(traces)} traces")
+    if summary.empty:
+        sys.exit(0)
+    print(summary.head(args.top).round(3).to_string(index=False))
+    if args.out:
+        summary.to_csv(args.out, index=False)
+        print(f"Summary saved to {args.out}")